@@ -0,0 +1,84 @@
+import time
+
+from pressure_conversion import channel_log_pressure
+
+class DeadbandFilter:
+    """Per-channel change detection that decides which readings are worth passing on.
+
+    Modes compare a reading with the last value that was passed:
+      absolute -- |new - old| in raw units (volts for the ion gauges, Pa for the TIC)
+      relative -- |new - old| / |old|
+      log      -- change in decades of pressure (log10 Torr)
+    A channel is also passed once its heartbeat interval has elapsed, so consumers
+    keep seeing a reading even while the pressure sits still.
+    """
+
+    MODES = ("absolute", "relative", "log")
+
+    def __init__(self, mode="log", threshold=0.02, heartbeat=120.0, channels=None, clock=time.monotonic):
+        self.default_settings = self.validate({"mode": mode, "threshold": threshold, "heartbeat": heartbeat})
+        # Optional per-channel overrides, e.g. {"Forline": {"mode": "relative", "threshold": 0.05}}
+        self.channel_settings = {
+            channel: self.validate({**self.default_settings, **settings})
+            for channel, settings in (channels or {}).items()
+        }
+        self.clock = clock
+        self.last_passed = {}  # channel -> (value, time)
+
+    def validate(self, settings):
+        if settings["mode"] not in self.MODES:
+            raise ValueError(f"Unknown deadband mode: {settings['mode']}")
+        if settings["threshold"] < 0:
+            raise ValueError("Deadband threshold must not be negative.")
+        return settings
+
+    def settings_for(self, channel):
+        return self.channel_settings.get(channel, self.default_settings)
+
+    def exceeds_deadband(self, channel, old, new):
+        """Return True if the change from old to new is significant for this channel."""
+        if old is None or new is None:
+            return old is not new
+        settings = self.settings_for(channel)
+        mode = settings["mode"]
+        if mode == "absolute":
+            change = abs(new - old)
+        elif mode == "relative":
+            if old == 0:
+                return new != 0
+            change = abs(new - old) / abs(old)
+        else:
+            old_log = channel_log_pressure(channel, old)
+            new_log = channel_log_pressure(channel, new)
+            if old_log is None or new_log is None:
+                return (old_log is None) != (new_log is None)
+            change = abs(new_log - old_log)
+        return change > settings["threshold"]
+
+    def should_pass(self, channel, value, now=None):
+        """Return True (and remember the value) if this reading should be passed on."""
+        now = self.clock() if now is None else now
+        last = self.last_passed.get(channel)
+        if last is not None:
+            last_value, last_time = last
+            heartbeat = self.settings_for(channel)["heartbeat"]
+            heartbeat_due = heartbeat is not None and now - last_time >= heartbeat
+            if not heartbeat_due and not self.exceeds_deadband(channel, last_value, value):
+                return False
+        self.last_passed[channel] = (value, now)
+        return True
+
+    def filter(self, readings, now=None):
+        """Return the subset of readings that passed the deadband (empty if none did)."""
+        now = self.clock() if now is None else now
+        return {
+            channel: value for channel, value in readings.items()
+            if self.should_pass(channel, value, now)
+        }
+
+    def reset(self, channel=None):
+        """Forget the last passed value so the next reading always passes."""
+        if channel is None:
+            self.last_passed.clear()
+        else:
+            self.last_passed.pop(channel, None)
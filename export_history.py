@@ -0,0 +1,329 @@
+import argparse
+import csv
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from history_log import HISTORY_DIRECTORY, HISTORY_COLUMNS, PRESSURE_COLUMNS, history_path
+from pressure_conversion import channel_pressure, channel_pressure_array
+
+EXPORT_DIRECTORY = "exports"
+
+# Stages below are generators, so an export holds at most one chunk of rows in memory.
+# Pressure exports run column-wise on numpy and pyarrow when both are installed (about
+# 10x faster); otherwise they fall back to the pure-Python row pipeline.
+
+def columnar_modules():
+    """Return (numpy, pyarrow) if the optional columnar export packages are installed, else None."""
+    try:
+        import numpy
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        return None
+    return numpy, pyarrow
+
+def parse_time(text):
+    """Parse an epoch timestamp or an ISO date/time (local time unless an offset is given)."""
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+def history_files(directory, kind, start, end):
+    """Yield the daily history files that may hold records between start and end."""
+    day = datetime.fromtimestamp(start, tz=timezone.utc).date()
+    last_day = datetime.fromtimestamp(end, tz=timezone.utc).date()
+    while day <= last_day:
+        path = history_path(directory, kind, day.strftime("%Y-%m-%d"))
+        if os.path.exists(path):
+            yield path
+        day += timedelta(days=1)
+
+def read_rows(directory, kind, start, end):
+    """Yield (timestamp, [raw column strings]) for every record with start <= timestamp < end."""
+    for path in history_files(directory, kind, start, end):
+        with open(path, newline="") as history_file:
+            reader = csv.reader(history_file)
+            next(reader, None)  # Header
+            for row in reader:
+                if not row:
+                    continue
+                timestamp = float(row[0])
+                if timestamp < start:
+                    continue
+                if timestamp >= end:
+                    break  # Records are appended in time order
+                yield timestamp, row[1:]
+
+def parse_pressure_rows(rows):
+    for timestamp, values in rows:
+        yield timestamp, [float(value) if value else None for value in values]
+
+def resample(rows, interval, start):
+    """Yield rows on a fixed grid from start, holding each channel's last known value."""
+    next_time = start
+    held = None
+    for timestamp, values in rows:
+        if held is None:
+            held = [None] * len(values)
+            # Skip the empty grid points before the first record
+            next_time = start + interval * max(0, int((timestamp - start) // interval))
+        while next_time < timestamp:
+            yield next_time, list(held)
+            next_time += interval
+        held = [value if value is not None else old for value, old in zip(values, held)]
+        last_time = timestamp
+    if held is not None:
+        while next_time <= last_time:
+            yield next_time, list(held)
+            next_time += interval
+
+def chunked(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def convert_column(channel, column):
+    # Readings are quantized by the ADC, so each distinct raw value is converted only once
+    cache = {}
+    converted = []
+    for value in column:
+        if value not in cache:
+            cache[value] = channel_pressure(channel, value)
+        converted.append(cache[value])
+    return converted
+
+def convert_chunk(chunk, channels):
+    """Convert a chunk of raw readings to Torr, one channel column at a time."""
+    timestamps = [timestamp for timestamp, values in chunk]
+    columns = zip(*(values for timestamp, values in chunk))
+    converted = [convert_column(channel, column) for channel, column in zip(channels, columns)]
+    return [(timestamp, list(values)) for timestamp, values in zip(timestamps, zip(*converted))]
+
+def export_chunks(kind, start, end, directory=HISTORY_DIRECTORY, interval=None, convert=True,
+                  chunk_size=10000):
+    """Yield chunks of (timestamp, values) rows of one history kind between start and end."""
+    if kind not in HISTORY_COLUMNS:
+        raise ValueError(f"Unknown history kind: {kind}")
+    rows = read_rows(directory, kind, start, end)
+    if kind == "pressure":
+        rows = parse_pressure_rows(rows)
+        if interval:
+            rows = resample(rows, interval, start)
+    for chunk in chunked(rows, chunk_size):
+        if kind == "pressure" and convert:
+            chunk = convert_chunk(chunk, HISTORY_COLUMNS[kind][1:])
+        yield chunk
+
+def write_csv(chunks, columns, output):
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    count = 0
+    for chunk in chunks:
+        writer.writerows([timestamp, *["" if value is None else value for value in values]]
+                         for timestamp, values in chunk)
+        count += len(chunk)
+    return count
+
+def write_parquet(chunks, columns, path):
+    """Write each chunk as one Parquet row group (requires the optional pyarrow package)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow).")
+
+    writer = None
+    count = 0
+    try:
+        for chunk in chunks:
+            data = {"timestamp": [timestamp for timestamp, values in chunk]}
+            for index, column in enumerate(columns[1:]):
+                data[column] = [values[index] for timestamp, values in chunk]
+            table = pa.table(data)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            count += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+def read_pressure_columns(directory, start, end):
+    """Yield (timestamps, [channel arrays]) numpy chunks of pressure records with start <= timestamp < end.
+
+    Readings missing from a record (held back by the deadband) are NaN.
+    """
+    np, pa = columnar_modules()
+    convert_options = pa.csv.ConvertOptions(
+        column_types={column: pa.float64() for column in PRESSURE_COLUMNS}, include_columns=PRESSURE_COLUMNS
+    )
+    # The last line of today's file may be half written
+    parse_options = pa.csv.ParseOptions(invalid_row_handler=lambda row: "skip")
+    for path in history_files(directory, "pressure", start, end):
+        if os.path.getsize(path) == 0:
+            continue
+        with pa.csv.open_csv(path, parse_options=parse_options, convert_options=convert_options) as reader:
+            for batch in reader:
+                timestamps = batch.column(0).to_numpy(zero_copy_only=False)
+                if len(timestamps) == 0 or timestamps[-1] < start:
+                    continue
+                if timestamps[0] >= end:
+                    break  # Records are appended in time order
+                selected = (timestamps >= start) & (timestamps < end)
+                columns = [batch.column(index).to_numpy(zero_copy_only=False)[selected]
+                           for index in range(1, len(PRESSURE_COLUMNS))]
+                yield timestamps[selected], columns
+
+def forward_fill(column, seed):
+    """Replace each NaN by the last earlier non-NaN value, or by seed before the first one."""
+    np, pa = columnar_modules()
+    values = np.concatenate(([seed], column))
+    indices = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(indices, out=indices)
+    return values[indices][1:]
+
+def resample_columns(batches, interval, start):
+    """Column-wise resample(): every grid point gets the last known value of each channel."""
+    np, pa = columnar_modules()
+    held = None
+    next_time = start
+    for timestamps, columns in batches:
+        if len(timestamps) == 0:
+            continue
+        if held is None:
+            held = [np.nan] * len(columns)
+            next_time = start + interval * max(0, int((timestamps[0] - start) // interval))
+        filled = [forward_fill(column, seed) for column, seed in zip(columns, held)]
+        # Grid points up to the last record of this batch; later ones may still see the next batch
+        grid = next_time + interval * np.arange(max(0, int((timestamps[-1] - next_time) // interval) + 1))
+        if len(grid):
+            record = np.searchsorted(timestamps, grid, side="right") - 1
+            before = record < 0
+            yield grid, [np.where(before, seed, column[np.maximum(record, 0)])
+                         for column, seed in zip(filled, held)]
+            next_time = grid[-1] + interval
+        held = [column[-1] for column in filled]
+
+def export_pressure_tables(start, end, directory=HISTORY_DIRECTORY, interval=None, convert=True):
+    """Yield pyarrow tables of pressure history between start and end, built column-wise."""
+    np, pa = columnar_modules()
+    batches = read_pressure_columns(directory, start, end)
+    if interval:
+        batches = resample_columns(batches, interval, start)
+    channels = PRESSURE_COLUMNS[1:]
+    for timestamps, columns in batches:
+        if convert:
+            columns = [channel_pressure_array(channel, column) for channel, column in zip(channels, columns)]
+        # from_pandas turns NaN into null, exported as an empty CSV cell like None
+        arrays = [pa.array(timestamps)] + [pa.array(column, from_pandas=True) for column in columns]
+        yield pa.Table.from_arrays(arrays, names=list(PRESSURE_COLUMNS))
+
+def write_table_stream(tables, writer):
+    count = 0
+    try:
+        for table in tables:
+            writer.write_table(table)
+            count += table.num_rows
+    finally:
+        writer.close()
+    return count
+
+def write_tables(tables, output, fmt):
+    """Write pyarrow tables as CSV (path, or "-" for stdout) or Parquet and return the row count."""
+    np, pa = columnar_modules()
+    schema = pa.schema([(column, pa.float64()) for column in PRESSURE_COLUMNS])
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return write_table_stream(tables, pq.ParquetWriter(output, schema))
+
+    # Same unquoted header as the row pipeline writes
+    header = (",".join(PRESSURE_COLUMNS) + "\n").encode()
+    options = pa.csv.WriteOptions(include_header=False)
+    if output == "-":
+        sys.stdout.flush()
+        sys.stdout.buffer.write(header)
+        return write_table_stream(tables, pa.csv.CSVWriter(sys.stdout.buffer, schema, write_options=options))
+    with open(output, "wb") as output_file:
+        output_file.write(header)
+        return write_table_stream(tables, pa.csv.CSVWriter(output_file, schema, write_options=options))
+
+def export_history(kind, start, end, output, fmt="csv", directory=HISTORY_DIRECTORY, interval=None,
+                   convert=True):
+    """Export one history kind to output (a path, or "-" for stdout with CSV) and return the row count."""
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    if kind == "pressure" and columnar_modules() is not None:
+        return write_tables(export_pressure_tables(start, end, directory, interval, convert), output, fmt)
+
+    chunks = export_chunks(kind, start, end, directory, interval, convert)
+    columns = HISTORY_COLUMNS[kind]
+    if fmt == "parquet":
+        return write_parquet(chunks, columns, output)
+    if output == "-":
+        return write_csv(chunks, columns, sys.stdout)
+    with open(output, "w", newline="") as output_file:
+        return write_csv(chunks, columns, output_file)
+
+def start_export(arguments, directory=HISTORY_DIRECTORY, export_directory=EXPORT_DIRECTORY):
+    """Run an export requested as "EXPORT <kind> <start> <end> [INTERVAL=s] [FORMAT=csv|parquet]".
+
+    The export runs in a background thread so the server loop keeps serving; the output
+    path is returned immediately.
+    """
+    if len(arguments) < 3:
+        raise ValueError("Usage: EXPORT <kind> <start> <end> [INTERVAL=s] [FORMAT=csv|parquet]")
+    kind, start, end = arguments[0], parse_time(arguments[1]), parse_time(arguments[2])
+    if kind not in HISTORY_COLUMNS:
+        raise ValueError(f"Unknown history kind: {kind}")
+    options = dict(argument.split("=", 1) for argument in arguments[3:] if "=" in argument)
+    fmt = options.get("FORMAT", "csv").lower()
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    interval = float(options["INTERVAL"]) if "INTERVAL" in options else None
+
+    os.makedirs(export_directory, exist_ok=True)
+    output = os.path.join(export_directory, f"{kind}_{int(start)}_{int(end)}.{fmt}")
+
+    def run():
+        try:
+            count = export_history(kind, start, end, output, fmt, directory, interval)
+            print(f"Exported {count} {kind} rows to {output}")
+        except Exception as e:
+            print(f"Error exporting {kind} history: {e}")
+
+    threading.Thread(target=run, name="history-export", daemon=True).start()
+    return output
+
+def main():
+    parser = argparse.ArgumentParser(description="Export pressure samples or valve events from the history files.")
+    parser.add_argument("kind", choices=sorted(HISTORY_COLUMNS))
+    parser.add_argument("--start", required=True, help="Epoch seconds or ISO date/time")
+    parser.add_argument("--end", required=True, help="Epoch seconds or ISO date/time")
+    parser.add_argument("--output", default="-", help="Output file (default: stdout, CSV only)")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--interval", type=float, help="Resample pressures to this interval in seconds")
+    parser.add_argument("--raw", action="store_true", help="Keep raw volts/Pa instead of converting to Torr")
+    parser.add_argument("--directory", default=HISTORY_DIRECTORY)
+    args = parser.parse_args()
+
+    if args.format == "parquet" and args.output == "-":
+        parser.error("Parquet export needs --output.")
+    try:
+        count = export_history(args.kind, parse_time(args.start), parse_time(args.end), args.output,
+                               args.format, args.directory, args.interval, not args.raw)
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Exported {count} rows.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import csv
+import os
+import time
+from datetime import datetime, timezone
+
+HISTORY_DIRECTORY = "history"
+
+# Column layout of the daily history files for each kind of record
+PRESSURE_COLUMNS = ("timestamp", "A0", "A1", "A2", "A3", "Forline")
+VALVE_COLUMNS = ("timestamp", "valve", "old", "new")
+HISTORY_COLUMNS = {"pressure": PRESSURE_COLUMNS, "valves": VALVE_COLUMNS}
+
+def history_day(timestamp):
+    """Return the UTC date string that names the history file holding timestamp."""
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+def history_path(directory, kind, day):
+    return os.path.join(directory, f"{kind}_{day}.csv")
+
+class HistoryWriter:
+    """Append records to one CSV file per UTC day, e.g. history/pressure_2024-11-01.csv."""
+
+    def __init__(self, kind, directory=HISTORY_DIRECTORY, clock=time.time):
+        if kind not in HISTORY_COLUMNS:
+            raise ValueError(f"Unknown history kind: {kind}")
+        self.kind = kind
+        self.directory = directory
+        self.columns = HISTORY_COLUMNS[kind]
+        self.clock = clock
+        self.day = None
+        self.file = None
+        self.writer = None
+
+    def open_day(self, day):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = history_path(self.directory, self.kind, day)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", buffering=1)  # Line buffered: one write per record
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(self.columns)
+        self.day = day
+
+    def append(self, record, timestamp=None):
+        """Append one record given as {column: value}; missing columns are left empty."""
+        timestamp = self.clock() if timestamp is None else timestamp
+        try:
+            day = history_day(timestamp)
+            if day != self.day:
+                self.open_day(day)
+            row = [repr(timestamp)] + ["" if record.get(column) is None else record[column]
+                                       for column in self.columns[1:]]
+            self.writer.writerow(row)
+        except OSError as e:
+            print(f"Error writing {self.kind} history: {e}")
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        self.file = None
+        self.writer = None
+        self.day = None
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import zmq
+import zmq.asyncio
+
+from pressure_reading_server import (
+    PressureStatusJSON, SerialPressureHandler, EdwardsTICReader, PressurePublisher, PressureService,
+    split_request
+)
+from pressure_reading_server import config as pressure_config
+from shared_snapshot import PressureSnapshotWriter
+from history_log import HistoryWriter
+from sampling_profiler import ServerProfiler, LoopTimer
+from valve_serial_command_server import ValveStatusJSON, SerialCommandHandler, ValveEventPublisher
+from valve_serial_command_server import config as valve_config
+from valve_state import ValveState
+
+# Configuration dictionary for the combined gateway
+config = {
+    'arduino_pressure_port': 'COM9',   # Replace with actual Arduino serial port
+    'tic_port': 'COM20',               # TIC controller port
+    'valve_port': 'COM10',             # Valve Arduino serial port
+    'pressure_address': "tcp://*:5555",
+    'valve_address': "tcp://*:5560",
+    'pressure_stream_address': pressure_config['publish_address'],
+    'valve_stream_address': valve_config['publish_address'],
+    'state_stream_address': "tcp://*:5570",
+    'reconcile_interval': valve_config['reconcile_interval']
+}
+
+class InterlockGateway:
+    """Single event loop hosting the pressure and valve services in one process.
+
+    Each serial device group is owned by a single worker thread, so blocking serial
+    exchanges never run concurrently on the same port and never stall the event loop.
+    Pressure and valve state are kept side by side, and interlock callbacks registered
+    with add_interlock() run in-process on every acquired reading and valve change,
+    without any ZMQ hop and ahead of the deadband that throttles disk and network output.
+    """
+
+    def __init__(self, pressure_service, pressure_publisher, valve_handler, settings=None, loop_timer=None):
+        self.settings = settings if settings else config
+        # An iteration is one acquisition step; the valve loops add their own sections
+        self.loop_timer = loop_timer if loop_timer else LoopTimer()
+        self.pressure_service = pressure_service
+        self.pressure_publisher = pressure_publisher
+        # Deadband-filtered readings are published straight from the pressure worker
+        self.pressure_service.publisher = pressure_publisher
+        self.valve_handler = valve_handler
+        self.pressure_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pressure-serial")
+        self.valve_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="valve-serial")
+        self.context = zmq.asyncio.Context()
+        self.pressures = {}
+        self.valve_state = ValveState()
+        self.valve_status = {}
+        self.interlocks = []
+        self.state_socket = None
+        self.loop = None
+        self.pressure_flight = None  # Hardware read currently in flight, shared by all requests
+        self.pending_replies = set()
+
+    def add_interlock(self, callback):
+        """Register callback(pressures, valve_status), called on the event loop after every change."""
+        self.interlocks.append(callback)
+
+    async def run_pressure(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pressure_worker, func, *args)
+
+    async def run_valve(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.valve_worker, func, *args)
+
+    def on_pressure_update(self, readings):
+        if readings:
+            self.pressures.update(readings)
+            self.state_changed()
+
+    def on_valve_update(self, valve_state):
+        self.valve_state = valve_state
+        self.valve_status = valve_state.to_dict()
+        self.state_changed()
+
+    def state_changed(self):
+        """Run the interlock callbacks and stream the combined state."""
+        for callback in self.interlocks:
+            try:
+                callback(self.pressures, self.valve_status)
+            except Exception as e:
+                print(f"Error in interlock callback: {e}")
+        if self.state_socket is not None:
+            state = {"pressure": self.pressures, "valves": self.valve_status, "timestamp": time.time()}
+            # Plain PUB sends never block, so the returned future needs no await
+            self.state_socket.send_string(f"STATE {json.dumps(state)}")
+
+    def poll_pressures(self):
+        """Scheduled acquisition step, run on the pressure worker; returns (readings, timeout_ms)."""
+        self.pressure_service.set_subscribers(self.pressure_publisher.drain_subscriptions())
+        pressure_readings = self.pressure_service.poll_due()
+        return pressure_readings, self.pressure_service.poll_timeout_ms()
+
+    def handle_valve_command(self, message):
+        """Handle a valve request on the valve worker and return the reply with the new state."""
+        response = self.valve_handler.handle_command(message)
+        return response, self.valve_handler.valve_state
+
+    async def acquire_pressures(self):
+        while True:
+            # A failing iteration must not stop acquisition or the other services
+            try:
+                with self.loop_timer.section("acquisition"):
+                    pressure_readings, timeout_ms = await self.run_pressure(self.poll_pressures)
+                with self.loop_timer.section("interlocks"):
+                    self.on_pressure_update(pressure_readings)
+            except Exception as e:
+                print(f"Error acquiring pressures: {e}")
+                timeout_ms = 1000
+            with self.loop_timer.section("acquisition_wait"):
+                await asyncio.sleep(timeout_ms / 1000)
+            self.loop_timer.end_iteration()
+
+    async def reconcile_valves(self):
+        while True:
+            try:
+                with self.loop_timer.section("reconcile"):
+                    events = await self.run_valve(self.valve_handler.reconcile)
+                if events:
+                    with self.loop_timer.section("valve_interlocks"):
+                        self.on_valve_update(self.valve_handler.valve_state)
+            except Exception as e:
+                print(f"Error reconciling valves: {e}")
+            await asyncio.sleep(self.settings['reconcile_interval'])
+
+    async def read_and_update(self):
+        pressure_readings = await self.run_pressure(self.pressure_service.read_pressures)
+        self.on_pressure_update(pressure_readings)
+        return pressure_readings
+
+    async def read_pressures_shared(self):
+        """Single-flight hardware read: concurrent callers all await the read already in flight."""
+        if self.pressure_flight is None:
+            self.pressure_flight = asyncio.ensure_future(self.read_and_update())
+            self.pressure_flight.add_done_callback(lambda _: setattr(self, "pressure_flight", None))
+        return await asyncio.shield(self.pressure_flight)
+
+    async def pressure_response(self, message):
+        try:
+            command, max_age = self.pressure_service.parse_request(message)
+        except ValueError as e:
+            return f"Error: {e}"
+
+        if command == "READ_PRESSURES":
+            pressure_readings = self.pressure_service.recent_readings(max_age)
+            if pressure_readings is None:
+                pressure_readings = await self.read_pressures_shared()
+            return self.pressure_service.format_readings(pressure_readings)
+        return await self.run_pressure(self.pressure_service.handle_command, message)
+
+    async def answer_pressure(self, socket, envelope, message):
+        # Every request gets a reply, otherwise its REQ client stays blocked
+        try:
+            response = await self.pressure_response(message)
+        except Exception as e:
+            print(f"Error handling pressure request: {e}")
+            response = f"Error: {e}"
+        await socket.send_multipart(envelope + [response.encode()])
+
+    async def serve_pressure(self, socket):
+        while True:
+            frames = await socket.recv_multipart()
+            request = split_request(frames)
+            if request is None:
+                print(f"Dropped malformed pressure request: {frames!r}")
+                continue
+            envelope, message = request
+            print(f"Received pressure request: {message}")
+            # Each request is answered by its own task so concurrent reads can coalesce
+            task = asyncio.create_task(self.answer_pressure(socket, envelope, message))
+            self.pending_replies.add(task)
+            task.add_done_callback(self.pending_replies.discard)
+
+    async def serve_valve(self, socket):
+        while True:
+            message = await socket.recv_string()
+            print(f"Received valve request: {message}")
+            try:
+                with self.loop_timer.section("valve_request"):
+                    response, valve_state = await self.run_valve(self.handle_valve_command, message)
+            except Exception as e:
+                print(f"Error handling valve request: {e}")
+                response, valve_state = f"Error: {e}", self.valve_state
+            await socket.send_string(response)
+            if valve_state != self.valve_state:
+                self.on_valve_update(valve_state)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        pressure_socket = self.context.socket(zmq.ROUTER)
+        pressure_socket.bind(self.settings['pressure_address'])
+        valve_socket = self.context.socket(zmq.REP)
+        valve_socket.bind(self.settings['valve_address'])
+        self.state_socket = self.context.socket(zmq.PUB)
+        self.state_socket.bind(self.settings['state_stream_address'])
+
+        self.valve_state = self.valve_handler.valve_state
+        self.valve_status = self.valve_state.to_dict()
+
+        print("Interlock gateway serving pressure on 5555, valves on 5560...")
+        try:
+            await asyncio.gather(
+                self.acquire_pressures(),
+                self.reconcile_valves(),
+                self.serve_pressure(pressure_socket),
+                self.serve_valve(valve_socket)
+            )
+        finally:
+            pressure_socket.close()
+            valve_socket.close()
+            self.state_socket.close()
+            self.state_socket = None
+
+    def close(self):
+        self.pressure_worker.shutdown(wait=True)
+        self.valve_worker.shutdown(wait=True)
+        self.pressure_publisher.close()
+        self.context.term()
+
+def main():
+    pressure_json_handler = PressureStatusJSON()
+    arduino_handler = SerialPressureHandler(config['arduino_pressure_port'], json_handler=pressure_json_handler)
+    tic_handler = EdwardsTICReader(config['tic_port'])
+
+    # The streams live on their own context; each is only touched from its device's worker
+    stream_context = zmq.Context()
+    pressure_publisher = PressurePublisher(stream_context, config['pressure_stream_address'])
+    valve_publisher = ValveEventPublisher(stream_context, config['valve_stream_address'])
+    valve_history = HistoryWriter("valves")
+    valve_handler = SerialCommandHandler(
+        config['valve_port'], json_handler=ValveStatusJSON(), event_publisher=valve_publisher,
+        history=valve_history
+    )
+    snapshot = PressureSnapshotWriter()
+    pressure_history = HistoryWriter("pressure")
+    # Samples every thread of the process; PROFILE commands arrive through the pressure port
+    profiler = ServerProfiler("interlock_gateway")
+    profiler.install_signal_handler()
+    pressure_service = PressureService(arduino_handler, tic_handler, pressure_json_handler, snapshot=snapshot,
+                                       history=pressure_history, profiler=profiler)
+    gateway = InterlockGateway(pressure_service, pressure_publisher, valve_handler, loop_timer=profiler.loop_timer)
+
+    try:
+        asyncio.run(gateway.run())
+    except KeyboardInterrupt:
+        print("Shutting down the gateway...")
+    finally:
+        profiler.stop()
+        gateway.close()
+        valve_publisher.close()
+        snapshot.close()
+        pressure_history.close()
+        valve_history.close()
+        stream_context.term()
+        if arduino_handler.serial_connection:
+            arduino_handler.serial_connection.close()
+        tic_handler.close_connection()
+        if valve_handler.serial_connection and valve_handler.serial_connection.is_open:
+            valve_handler.serial_connection.close()
+        print("Gateway stopped.")
+
+if __name__ == "__main__":
+    main()
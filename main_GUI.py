@@ -4,92 +4,131 @@ import json
 import subprocess
 import psutil
 import atexit
+import queue
+import time
+import uuid
 import zmq
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QVBoxLayout, QLabel, QGridLayout, QTabWidget, QMessageBox, QHBoxLayout
 )
 from PyQt5.QtCore import QThread, pyqtSignal
-from PyQt5.QtCore import QCoreApplication 
-
-# Conversion factor from Pa to Torr
-PA_TO_TORR = 0.00750062
-
-# Dictionary to map pin names to gauge designations
-pin_gauge_dict = {
-    "A0": "A",
-    "A1": "B",
-    "A2": "C",
-    "A3": "E"
-}
-
-# Filament current settings dictionary
-FilamentCurrent = {"A": 1, "B": 1, "C": 0.1, "E": 1}
-
-def format_scientific(value):
-    """Format number in scientific notation with 1 decimal place."""
-    return f"{value:.1e}"
-
-def voltage_to_pressure(voltage: float, filament_current):
-    """Convert voltage to pressure."""
-    pressure_exp_dict = {0.1: 10, 1: 11, 10: 12}
-    actual_voltage = voltage * 2
-    if actual_voltage >= 10:
-        return "Ion gauge off!"
-    else:
-        pressure = 10 ** (actual_voltage - pressure_exp_dict[filament_current])
-        return format_scientific(pressure)
+from deadband_filter import DeadbandFilter
+from reliable_client import LazyPirateClient
+from valve_state import ValveState, OPEN
+from pressure_conversion import (
+    PA_TO_TORR, pin_gauge_dict, FilamentCurrent, format_scientific, voltage_to_pressure
+)
 
 # ZMQ Clients for valve and pressure servers
 class ValveZMQClient(QThread):
-    valve_data_ready = pyqtSignal(dict)
+    """Send valve commands from a worker thread so retries never block the UI.
+
+    Commands are queued by send_command() and sent one at a time; each result is
+    emitted as command_finished(command, success, response).
+    """
+    command_finished = pyqtSignal(str, bool, str)
 
     def __init__(self, server_address="tcp://localhost:5560"):
         super().__init__()
         self.server_address = server_address
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REQ)
-        self.socket.connect(server_address)
+        self.client = LazyPirateClient(server_address, context=self.context, timeout=2500, retries=2)
+        self.commands = queue.Queue()
         self.running = True
 
     def send_command(self, command):
-        try:
-            self.socket.send_string(command)
-            response = self.socket.recv_string()
-            return True, response
-        except Exception as e:
-            return False, f"Failed to send command: {e}"
+        self.commands.put(command)
+
+    def run(self):
+        while self.running:
+            command = self.commands.get()
+            if command is None:  # Wake-up from stop()
+                break
+            # The request ID makes retries safe: the server replays its reply instead of actuating twice
+            success, response = self.client.request(f"{command} ID={uuid.uuid4().hex}")
+            if not success:
+                response = f"Failed to send command: {response}"
+            self.command_finished.emit(command, success, response)
 
     def stop(self):
         self.running = False
+        self.commands.put(None)
         self.quit()
 
 class PressureZMQClient(QThread):
+    """Receive pressures from the server's deadband-filtered stream.
+
+    Subscribing also counts the GUI as a consumer, so the server polls faster while it is
+    open. A READ_PRESSURES request fills the display at start-up and whenever the stream has
+    been silent for silence_timeout; its MAX_AGE lets the server answer from its scheduled
+    reads instead of forcing an extra hardware read.
+    """
     pressure_data_ready = pyqtSignal(dict)
 
-    def __init__(self, server_address="tcp://localhost:5555"):
+    def __init__(self, server_address="tcp://localhost:5555", stream_address="tcp://localhost:5556",
+                 max_age=10.0, silence_timeout=15.0):
         super().__init__()
         self.server_address = server_address
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REQ)
-        self.socket.connect(server_address)
+        self.client = LazyPirateClient(server_address, context=self.context, timeout=2500, retries=1)
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.setsockopt_string(zmq.SUBSCRIBE, "PRESSURE ")
+        self.socket.connect(stream_address)
+        self.max_age = max_age
+        self.silence_timeout = silence_timeout
         self.running = True
 
+    def request_pressures(self):
+        success, message = self.client.request(f"READ_PRESSURES MAX_AGE={self.max_age:g}")
+        if success:
+            try:
+                self.pressure_data_ready.emit(json.loads(message))
+            except json.JSONDecodeError:
+                pass
+
     def run(self):
+        last_update = None
         while self.running:
-            command = "READ_PRESSURES"
-            self.socket.send_string(command)
+            if last_update is None or time.monotonic() - last_update >= self.silence_timeout:
+                self.request_pressures()
+                last_update = time.monotonic()
 
+            # Poll with a timeout so stop() is honoured while the stream is quiet
+            if not self.socket.poll(timeout=500):
+                continue
             try:
-                message = self.socket.recv_string()
-                try:
-                    data = json.loads(message)
-                    self.pressure_data_ready.emit(data)
-                except json.JSONDecodeError:
-                    pass
-            except zmq.ZMQError:
+                topic, payload = self.socket.recv_string().split(" ", 1)
+                self.pressure_data_ready.emit(json.loads(payload))
+                last_update = time.monotonic()
+            except (ValueError, zmq.ZMQError):
                 pass
 
-            self.msleep(5000)
+    def stop(self):
+        self.running = False
+        self.quit()
+
+class ValveEventSubscriber(QThread):
+    valve_event_ready = pyqtSignal(dict)
+
+    def __init__(self, server_address="tcp://localhost:5561"):
+        super().__init__()
+        self.server_address = server_address
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.setsockopt_string(zmq.SUBSCRIBE, "VALVE_EVENT")
+        self.socket.connect(server_address)
+        self.running = True
+
+    def run(self):
+        while self.running:
+            # Poll with a timeout so stop() is honoured while no events arrive
+            if not self.socket.poll(timeout=500):
+                continue
+            try:
+                topic, payload = self.socket.recv_string().split(" ", 1)
+                self.valve_event_ready.emit(json.loads(payload))
+            except (ValueError, zmq.ZMQError):
+                pass
 
     def stop(self):
         self.running = False
@@ -145,19 +184,26 @@ class ControlGUI(QWidget):
         # Initialize server managers and UI components
         self.valve_server_manager = ServerManager("valve_serial_command_server.py", "valve_server_pid.txt")
         self.pressure_server_manager = ServerManager("pressure_reading_server.py", "pressure_server_pid.txt")
+        # Only redraw gauges whose reading changed visibly; labels keep their last text otherwise
+        self.redraw_filter = DeadbandFilter(mode="log", threshold=0.02, heartbeat=None)
         self.init_ui()
 
         # Initialize ZMQ clients
         self.valve_client = ValveZMQClient("tcp://localhost:5560")
-        self.pressure_client = PressureZMQClient("tcp://localhost:5555")
+        self.pressure_client = PressureZMQClient("tcp://localhost:5555", "tcp://localhost:5556")
+        self.valve_event_subscriber = ValveEventSubscriber("tcp://localhost:5561")
 
         # Connect signals
+        self.valve_client.command_finished.connect(self.valve_command_finished)
         self.pressure_client.pressure_data_ready.connect(self.update_pressure_readings)
+        self.valve_event_subscriber.valve_event_ready.connect(self.apply_valve_event)
 
         # Start servers and data fetch
         self.start_valve_server()
         self.start_pressure_server()
+        self.valve_client.start()
         self.pressure_client.start()
+        self.valve_event_subscriber.start()
 
         # Fetch and display the initial valve status
         self.fetch_valve_status()
@@ -229,6 +275,7 @@ class ControlGUI(QWidget):
 
     def update_pressure_readings(self, readings):
         """Update the pressure readings display using gauge designations."""
+        readings = self.redraw_filter.filter(readings)
         for pin, voltage in readings.items():
             if pin == "Forline":
                 # Convert Forline pressure from Pa to Torr and format it
@@ -262,32 +309,39 @@ class ControlGUI(QWidget):
         self.valve_layout.addLayout(grid_layout)
 
     def toggle_valve(self, valve_name):
-        """Send command to open/close valve and update UI."""
+        """Queue the command to open/close a valve; the button stays disabled until it is answered."""
         current_status = "OPEN" if self.valve_buttons[valve_name].isChecked() else "CLOSE"
-        success, response = self.valve_client.send_command(f"{current_status}_{valve_name}")
+        self.valve_buttons[valve_name].setEnabled(False)
+        self.valve_client.send_command(f"{current_status}_{valve_name}")
 
+    def fetch_valve_status(self):
+        """Queue a request for the status of the valves; show_valve_status() updates the buttons."""
+        self.valve_client.send_command("STATUS_VALVES")
+
+    def valve_command_finished(self, command, success, response):
+        """Update the UI once the valve client has an answer to a queued command."""
+        if command == "STATUS_VALVES":
+            self.show_valve_status(success, response)
+            return
+
+        current_status, valve_name = command.split("_", 1)
+        button = self.valve_buttons[valve_name]
+        button.setEnabled(True)
         if success:
             action = "Closed" if current_status == "CLOSE" else "Opened"
-            self.valve_buttons[valve_name].setText(f"{action} {valve_name}")
+            button.setText(f"{action} {valve_name}")
         else:
+            # The valve did not move: put the button back in its previous state
+            button.setChecked(current_status == "CLOSE")
             QMessageBox.warning(self, "Error", f"Failed to toggle {valve_name}. {response}")
 
-    def fetch_valve_status(self):
-        """Fetch the initial status of the valves and update the buttons."""
-        success, response = self.valve_client.send_command("STATUS_VALVES")
+    def show_valve_status(self, success, response):
+        """Set the valve buttons from a STATUS_VALVES response."""
         if success:
             try:
                 if response.startswith("VALVE_STATUS:"):
-                    # Remove the "VALVE_STATUS:" prefix and parse the valve statuses
-                    response = response.replace("VALVE_STATUS:", "").strip()
-                    valve_statuses = {}
-
-                    # Split the response into individual valve updates
-                    for update in response.split(","):
-                        if "=" in update:
-                            valve, status = update.split("=")
-                            # Normalize valve name to uppercase to match button names
-                            valve_statuses[valve.strip().upper()] = status.strip().upper()
+                    # Parse into canonical VALVE_n names, which match the button names
+                    valve_statuses = ValveState.parse_status_line(response)
 
                     # # Debug: Print the parsed valve statuses
                     # print("Parsed Valve Statuses:", valve_statuses)
@@ -295,21 +349,23 @@ class ControlGUI(QWidget):
                     # Update the valve buttons based on the parsed statuses
                     for valve_name, status in valve_statuses.items():
                         if valve_name in self.valve_buttons:
-                            is_open = status == "OPEN"
+                            is_open = status == OPEN
                             # Set the button's state and text
                             self.valve_buttons[valve_name].setChecked(is_open)
                             self.valve_buttons[valve_name].setText(f"{'Opened' if is_open else 'Closed'} {valve_name}")
-
-                            # Force an update on the button to reflect changes
-                            self.valve_buttons[valve_name].repaint()
-
-                    # Force a refresh of the entire application
-                    QCoreApplication.processEvents()
                 else:
                     QMessageBox.warning(self, "Error", "Unexpected response format from valve server.")
             except Exception as e:
                 QMessageBox.warning(self, "Error", f"Failed to decode valve status response: {e}")
 
+    def apply_valve_event(self, event):
+        """Update a valve button from a change event published by the valve server."""
+        valve_name = event.get("valve")
+        if valve_name in self.valve_buttons:
+            is_open = event.get("new") == OPEN
+            self.valve_buttons[valve_name].setChecked(is_open)
+            self.valve_buttons[valve_name].setText(f"{'Opened' if is_open else 'Closed'} {valve_name}")
+
     def start_valve_server(self):
         """Start the valve server."""
         started, message = self.valve_server_manager.start_server()
@@ -332,7 +388,9 @@ class ControlGUI(QWidget):
 
     def closeEvent(self, event):
         """Ensure clients and threads stop when GUI closes."""
+        self.valve_client.stop()
         self.pressure_client.stop()
+        self.valve_event_subscriber.stop()
         self.valve_server_manager.stop_server()
         self.pressure_server_manager.stop_server()
         event.accept()
@@ -0,0 +1,107 @@
+import math
+import time
+
+from pressure_conversion import channel_log_pressure
+
+class ChannelPollState:
+    def __init__(self, channel, threshold=None):
+        self.channel = channel
+        # Interlock threshold stored as log10 Torr so it compares directly with readings
+        self.log_threshold = math.log10(threshold) if threshold else None
+        self.last_poll = None
+        self.last_sample_time = None
+        self.last_log_pressure = None
+        self.rate = 0.0  # Smoothed rate of change in decades per second (positive = rising)
+
+class AdaptivePollingScheduler:
+    """Adapt the polling interval of each channel to how fast its pressure is moving."""
+
+    def __init__(self, channels, floor_interval=0.2, ceiling_interval=10.0, thresholds=None,
+                 max_step_decades=0.02, approach_fraction=0.1, near_threshold_decades=1.0,
+                 past_threshold_interval=1.0, subscriber_gain=0.5, smoothing=0.5, clock=time.monotonic):
+        if floor_interval <= 0 or ceiling_interval < floor_interval:
+            raise ValueError("Polling intervals must satisfy 0 < floor <= ceiling.")
+        thresholds = thresholds or {}
+        self.floor_interval = floor_interval
+        self.ceiling_interval = ceiling_interval
+        self.max_step_decades = max_step_decades
+        self.approach_fraction = approach_fraction
+        self.near_threshold_decades = near_threshold_decades
+        self.past_threshold_interval = past_threshold_interval
+        self.subscriber_gain = subscriber_gain
+        self.smoothing = smoothing
+        self.clock = clock
+        self.subscribers = 0
+        self.channels = {
+            channel: ChannelPollState(channel, thresholds.get(channel)) for channel in channels
+        }
+
+    def set_subscribers(self, count):
+        """Set the number of clients currently consuming the pressure stream."""
+        self.subscribers = max(0, int(count))
+
+    def record(self, channel, value, timestamp=None):
+        """Record a raw reading for a channel; None marks a failed or off-scale poll."""
+        state = self.channels.get(channel)
+        if state is None:
+            return
+        now = self.clock() if timestamp is None else timestamp
+        state.last_poll = now
+        log_pressure = channel_log_pressure(channel, value)
+        if log_pressure is None:
+            # No pressure to extrapolate from (gauge off or poll failed): forget the trend so
+            # the channel falls back to the ceiling instead of staying pinned at the floor
+            state.last_log_pressure = None
+            state.last_sample_time = None
+            state.rate = 0.0
+            return
+
+        if state.last_log_pressure is not None and now > state.last_sample_time:
+            instant_rate = (log_pressure - state.last_log_pressure) / (now - state.last_sample_time)
+            state.rate = self.smoothing * instant_rate + (1 - self.smoothing) * state.rate
+        state.last_log_pressure = log_pressure
+        state.last_sample_time = now
+
+    def interval(self, channel):
+        """Return the current polling interval for a channel in seconds."""
+        state = self.channels[channel]
+        interval = self.ceiling_interval / (1 + self.subscriber_gain * self.subscribers)
+
+        # Rate of rise: limit the change between two samples to max_step_decades
+        speed = abs(state.rate)
+        if speed > 0:
+            interval = min(interval, self.max_step_decades / speed)
+
+        # Threshold proximity: poll faster the closer the reading is to its interlock limit
+        if state.log_threshold is not None and state.last_log_pressure is not None:
+            distance = state.log_threshold - state.last_log_pressure
+            if distance <= 0:
+                # Past the limit (e.g. Forline at atmosphere during a vent): the rate limit
+                # above still speeds polling up while the reading moves
+                interval = min(interval, self.past_threshold_interval)
+            else:
+                if distance < self.near_threshold_decades:
+                    interval = min(interval, self.ceiling_interval * distance / self.near_threshold_decades)
+                if state.rate > 0:
+                    interval = min(interval, self.approach_fraction * distance / state.rate)
+
+        return min(max(interval, self.floor_interval), self.ceiling_interval)
+
+    def next_due(self, channel):
+        """Return the clock time at which a channel should next be polled."""
+        state = self.channels[channel]
+        if state.last_poll is None:
+            return float("-inf")
+        return state.last_poll + self.interval(channel)
+
+    def due_channels(self, now=None):
+        """Return the channels whose polling interval has elapsed."""
+        now = self.clock() if now is None else now
+        return [channel for channel in self.channels if self.next_due(channel) <= now]
+
+    def time_until_next(self, now=None):
+        """Return the seconds until the next channel becomes due (0 if one already is)."""
+        now = self.clock() if now is None else now
+        if not self.channels:
+            return self.ceiling_interval
+        return max(0.0, min(self.next_due(channel) for channel in self.channels) - now)
@@ -0,0 +1,89 @@
+import math
+
+# Conversion factor from Pa to Torr
+PA_TO_TORR = 0.00750062
+
+# Dictionary to map pin names to gauge designations
+pin_gauge_dict = {
+    "A0": "A",
+    "A1": "B",
+    "A2": "C",
+    "A3": "E"
+}
+
+# Filament current settings dictionary
+FilamentCurrent = {"A": 1, "B": 1, "C": 0.1, "E": 1}
+
+# Decade offset of the ion gauge controller output for each filament current
+pressure_exp_dict = {0.1: 10, 1: 11, 10: 12}
+
+# Scale from the voltage the Arduino reports to the controller output, and the controller
+# output at or above which the ion gauge is off
+ION_GAUGE_VOLTAGE_SCALE = 2
+ION_GAUGE_OFF_VOLTAGE = 10
+
+def format_scientific(value):
+    """Format number in scientific notation with 1 decimal place."""
+    return f"{value:.1e}"
+
+def ion_gauge_curve(voltage, filament_current):
+    """Return (controller voltage, log10 pressure in Torr); voltage may be a float or a numpy array.
+
+    The log pressure is only meaningful where the controller voltage is below ION_GAUGE_OFF_VOLTAGE.
+    """
+    actual_voltage = voltage * ION_GAUGE_VOLTAGE_SCALE
+    return actual_voltage, actual_voltage - pressure_exp_dict[filament_current]
+
+def channel_filament_current(channel):
+    """Return the filament current of an Arduino channel's gauge, or None if it has no ion gauge."""
+    gauge = pin_gauge_dict.get(channel)
+    if gauge is None:
+        return None
+    return FilamentCurrent.get(gauge, 1)
+
+def voltage_to_log_pressure(voltage: float, filament_current):
+    """Convert voltage to log10 pressure in Torr, or None if the ion gauge is off."""
+    actual_voltage, log_pressure = ion_gauge_curve(voltage, filament_current)
+    if actual_voltage >= ION_GAUGE_OFF_VOLTAGE:
+        return None
+    return log_pressure
+
+def voltage_to_pressure(voltage: float, filament_current):
+    """Convert voltage to pressure."""
+    log_pressure = voltage_to_log_pressure(voltage, filament_current)
+    if log_pressure is None:
+        return "Ion gauge off!"
+    return format_scientific(10 ** log_pressure)
+
+def channel_log_pressure(channel, value):
+    """Convert a raw server reading (Arduino volts or TIC Pa) to log10 pressure in Torr."""
+    if value is None:
+        return None
+    if channel == "Forline":
+        if value <= 0:
+            return None
+        return math.log10(value * PA_TO_TORR)
+    filament_current = channel_filament_current(channel)
+    if filament_current is None:
+        return None
+    return voltage_to_log_pressure(value, filament_current)
+
+def channel_pressure(channel, value):
+    """Convert a raw server reading to pressure in Torr, or None if it has no valid pressure."""
+    if channel == "Forline":
+        return None if value is None else value * PA_TO_TORR
+    log_pressure = channel_log_pressure(channel, value)
+    return None if log_pressure is None else 10 ** log_pressure
+
+def channel_pressure_array(channel, values):
+    """Vectorized channel_pressure() for a numpy float array; NaN where there is no valid pressure."""
+    import numpy as np
+
+    if channel == "Forline":
+        return values * PA_TO_TORR
+    filament_current = channel_filament_current(channel)
+    if filament_current is None:
+        return np.full_like(values, np.nan)
+    actual_voltage, log_pressure = ion_gauge_curve(values, filament_current)
+    with np.errstate(invalid="ignore"):
+        return np.where(actual_voltage >= ION_GAUGE_OFF_VOLTAGE, np.nan, 10.0 ** log_pressure)
@@ -3,10 +3,39 @@ import json
 import serial
 import time
 import re
+import math
 
-# Configuration dictionary for pressure units
+from polling_scheduler import AdaptivePollingScheduler
+from deadband_filter import DeadbandFilter
+from shared_snapshot import PressureSnapshotWriter
+from rolling_stats import RollingStatistics
+from history_log import HistoryWriter
+from export_history import start_export
+from serial_link import open_link
+from sampling_profiler import ServerProfiler
+
+# Configuration dictionary for pressure units and acquisition
 config = {
-    'pressure_unit_dictionary': {66: "V", 59: "Pa", 81: "%"}
+    'pressure_unit_dictionary': {66: "V", 59: "Pa", 81: "%"},
+    'publish_address': "tcp://*:5556",
+    'polling': {
+        'floor_interval': 0.2,      # Fastest polling interval per channel (s)
+        'ceiling_interval': 10.0,   # Slowest polling interval per channel (s)
+        'max_step_decades': 0.02,   # Largest log-pressure change allowed between two samples
+        'approach_fraction': 0.1,   # Poll at this fraction of the projected time to threshold
+        'near_threshold_decades': 1.0,
+        'past_threshold_interval': 1.0,  # Polling interval while a reading sits beyond its threshold (s)
+        'subscriber_gain': 0.5,
+        # Interlock thresholds in Torr
+        'thresholds': {"A0": 1e-5, "A1": 1e-5, "A2": 1e-5, "A3": 1e-5, "Forline": 1e-1}
+    },
+    'deadband': {
+        'mode': "log",              # absolute, relative or log (decades)
+        'threshold': 0.02,          # Minimum change that is published and persisted
+        'heartbeat': 120.0,         # Pass a reading at least this often (s) even if unchanged
+        'channels': {}              # Per-channel overrides of mode/threshold/heartbeat
+    },
+    'stats_windows': (10.0, 60.0, 600.0)  # Rolling statistics window lengths (s)
 }
 
 class PressureStatusJSON:
@@ -63,8 +92,8 @@ class SerialPressureHandler:
     def init_serial_connection(self):
         """Initialize the serial connection."""
         try:
-            self.serial_connection = serial.Serial(self.serial_port, self.baudrate, timeout=1)
-            time.sleep(2)
+            self.serial_connection = open_link(self.serial_port, self.baudrate, timeout=1)
+            self.serial_connection.settle(2)
             print(f"Connected to serial port {self.serial_port}")
         except Exception as e:
             print(f"Error connecting to serial port: {e}")
@@ -74,7 +103,7 @@ class SerialPressureHandler:
         if self.serial_connection and self.serial_connection.is_open:
             try:
                 self.serial_connection.write("READ_VOLTAGES\n".encode())
-                time.sleep(0.1)
+                self.serial_connection.settle(0.1)
                 response = self.serial_connection.readline().decode().strip()
                 
                 if response.startswith("Voltages:"):
@@ -111,8 +140,8 @@ class EdwardsTICReader:
     def init_serial_connection(self):
         """Initialize the serial connection to the TIC controller."""
         try:
-            self.serial_connection = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
-            time.sleep(2)
+            self.serial_connection = open_link(self.port, self.baudrate, timeout=self.timeout)
+            self.serial_connection.settle(2)
             print(f"Connected to Edwards TIC on {self.port}")
         except serial.SerialException as e:
             print(f"Error connecting to TIC controller: {e}")
@@ -122,7 +151,7 @@ class EdwardsTICReader:
         if self.serial_connection and self.serial_connection.is_open:
             try:
                 self.serial_connection.write(b"?V913\r")
-                time.sleep(0.1)
+                self.serial_connection.settle(0.1)
                 reply = self.serial_connection.readline().decode().strip()
                 
                 pressure_value = float(reply.split(" ")[1].split(";")[0])
@@ -142,6 +171,253 @@ class EdwardsTICReader:
             self.serial_connection.close()
             print("Closed serial connection to TIC controller.")
 
+class PressurePublisher:
+    """XPUB socket that streams readings and keeps count of its subscribers."""
+
+    def __init__(self, context, address):
+        self.socket = context.socket(zmq.XPUB)
+        # Deliver every (un)subscription so duplicate subscribers are counted too
+        self.socket.setsockopt(zmq.XPUB_VERBOSER, 1)
+        self.socket.bind(address)
+        self.subscriber_count = 0
+
+    def drain_subscriptions(self):
+        """Consume pending subscription messages and update the subscriber count."""
+        while True:
+            try:
+                message = self.socket.recv(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            if message[:1] == b"\x01":
+                self.subscriber_count += 1
+            elif message[:1] == b"\x00":
+                self.subscriber_count = max(0, self.subscriber_count - 1)
+        return self.subscriber_count
+
+    def publish(self, readings, stats=None):
+        self.socket.send_string(f"PRESSURE {json.dumps(readings)}")
+        if stats is not None:
+            self.socket.send_string(f"STATS {json.dumps(stats)}")
+
+    def close(self):
+        self.socket.close()
+
+class PressureService:
+    """Acquire pressures on demand and on an adaptive schedule, then persist and publish changes."""
+
+    ARDUINO_CHANNELS = ("A0", "A1", "A2", "A3")
+    TIC_CHANNEL = "Forline"
+
+    def __init__(self, arduino_handler, tic_handler, json_handler, scheduler=None, publisher=None,
+                 deadband=None, snapshot=None, stats=None, history=None, profiler=None, clock=time.monotonic):
+        self.arduino_handler = arduino_handler
+        self.tic_handler = tic_handler
+        self.json_handler = json_handler
+        self.clock = clock
+        self.scheduler = scheduler if scheduler else AdaptivePollingScheduler(
+            self.ARDUINO_CHANNELS + (self.TIC_CHANNEL,), **config['polling'], clock=clock
+        )
+        self.publisher = publisher
+        self.deadband = deadband if deadband else DeadbandFilter(**config['deadband'], clock=clock)
+        self.snapshot = snapshot
+        self.stats = stats if stats else RollingStatistics(config['stats_windows'], clock=clock)
+        self.history = history
+        self.profiler = profiler
+        self.latest_readings = {}
+        self.reading_times = {}  # channel -> clock time of its latest reading, scheduled or on demand
+        # (monotonic completion time, readings or None if it failed) of the last full read
+        self.last_read = None
+
+    def recent_readings(self, max_age):
+        """Return the latest reading of every channel if each is at most max_age seconds old, else None.
+
+        Scheduled polls count too, so clients passing MAX_AGE are served at the scheduler's pace.
+        """
+        if max_age is None:
+            return None
+        now = self.clock()
+        channels = self.ARDUINO_CHANNELS + (self.TIC_CHANNEL,)
+        if all(channel in self.reading_times and now - self.reading_times[channel] <= max_age
+               for channel in channels):
+            return {channel: self.latest_readings[channel] for channel in channels}
+        return None
+
+    def read_pressures(self, max_age=None):
+        """Read every gauge, unless every channel was read at most max_age seconds ago."""
+        pressure_readings = self.recent_readings(max_age)
+        if pressure_readings is not None:
+            return pressure_readings
+
+        arduino_readings = self.arduino_handler.send_read_command()
+        tic_pressure, tic_unit = self.tic_handler.get_pressure_reading()
+
+        if arduino_readings is None or tic_pressure is None:
+            if arduino_readings is None:
+                self.mark_failed(self.ARDUINO_CHANNELS)
+            if tic_pressure is None:
+                self.mark_failed((self.TIC_CHANNEL,))
+            self.last_read = (self.clock(), None)
+            return None
+        pressure_readings = {**arduino_readings, self.TIC_CHANNEL: tic_pressure}
+        self.last_read = (self.clock(), pressure_readings)
+        self.update(pressure_readings)
+        return pressure_readings
+
+    def poll_due(self):
+        """Read the devices that have a channel due for polling."""
+        due = self.scheduler.due_channels()
+        if not due:
+            return None
+
+        arduino_readings = None
+        tic_pressure = None
+        if any(channel in self.ARDUINO_CHANNELS for channel in due):
+            arduino_readings = self.arduino_handler.send_read_command()
+            if arduino_readings is None:
+                self.mark_failed(self.ARDUINO_CHANNELS)
+        if self.TIC_CHANNEL in due:
+            tic_pressure, tic_unit = self.tic_handler.get_pressure_reading()
+            if tic_pressure is None:
+                self.mark_failed((self.TIC_CHANNEL,))
+
+        pressure_readings = dict(arduino_readings or {})
+        if tic_pressure is not None:
+            pressure_readings[self.TIC_CHANNEL] = tic_pressure
+        if pressure_readings:
+            self.update(pressure_readings)
+        return pressure_readings
+
+    def mark_failed(self, channels):
+        """Mark channels of a failed device as polled so a dead port is not retried in a tight loop."""
+        for channel in channels:
+            self.scheduler.record(channel, None)
+
+    def update(self, pressure_readings):
+        """Feed new readings to the scheduler; persist and publish only if one passed the deadband."""
+        for channel, value in pressure_readings.items():
+            self.scheduler.record(channel, value)
+            self.stats.add(channel, value)
+        self.latest_readings.update(pressure_readings)
+        now = self.clock()
+        for channel in pressure_readings:
+            self.reading_times[channel] = now
+        # Same-host readers get every reading; only the deadband decides disk and network traffic
+        if self.snapshot:
+            self.snapshot.write(pressure_readings)
+
+        changed = self.deadband.filter(pressure_readings)
+        if changed:
+            if self.history:
+                self.history.append(changed)
+            self.json_handler.write_status(self.latest_readings)
+            if self.publisher:
+                self.publisher.publish(self.latest_readings, self.stats.summary())
+        return changed
+
+    def set_subscribers(self, count):
+        self.scheduler.set_subscribers(count)
+
+    def poll_timeout_ms(self, max_timeout=1000):
+        """Return how long the socket may block before the next scheduled acquisition."""
+        return math.ceil(min(max_timeout, self.scheduler.time_until_next() * 1000))
+
+    @staticmethod
+    def parse_request(message):
+        """Split a request such as "READ_PRESSURES MAX_AGE=2.5" into (command, max_age)."""
+        parts = message.split()
+        command = parts[0] if parts else ""
+        max_age = None
+        for part in parts[1:]:
+            if part.startswith("MAX_AGE="):
+                try:
+                    max_age = float(part[len("MAX_AGE="):])
+                except ValueError:
+                    raise ValueError(f"Invalid MAX_AGE: {part}")
+        return command, max_age
+
+    @staticmethod
+    def format_readings(pressure_readings):
+        if pressure_readings is not None:
+            return json.dumps(pressure_readings)
+        return "Error: Failed to read pressures"
+
+    def handle_command(self, message, queued_since=None):
+        """Handle an incoming request and return the reply string.
+
+        queued_since is the service clock time since which the request has been waiting; a read
+        that completed after it was in flight while the request queued, and its result is
+        reused, failure included, so a dead port is not read once per queued client.
+        """
+        try:
+            command, max_age = self.parse_request(message)
+        except ValueError as e:
+            return f"Error: {e}"
+
+        if command == "READ_PRESSURES":
+            if queued_since is not None and self.last_read is not None:
+                completed, pressure_readings = self.last_read
+                if completed >= queued_since:
+                    return self.format_readings(pressure_readings)
+            return self.format_readings(self.read_pressures(max_age))
+        elif command == "STATS":
+            # Optional channel argument, e.g. "STATS A0"
+            channels = [part for part in message.split()[1:] if "=" not in part]
+            return json.dumps(self.stats.summary(channels[0] if channels else None))
+        elif command == "EXPORT":
+            try:
+                return f"EXPORT_STARTED {start_export(message.split()[1:])}"
+            except ValueError as e:
+                return f"Error: {e}"
+        elif command == "PROFILE" and self.profiler:
+            return self.profiler.handle_command(message.split()[1:])
+        return "Unknown command"
+
+def split_request(frames):
+    """Split a ROUTER message into (envelope, message), or return None if it is malformed."""
+    if b"" not in frames:
+        return None
+    delimiter = frames.index(b"")
+    try:
+        return frames[:delimiter + 1], frames[-1].decode()
+    except UnicodeDecodeError:
+        return None
+
+def receive_pending(socket):
+    """Receive every request waiting on a ROUTER socket as (envelope, message) pairs."""
+    requests = []
+    while True:
+        try:
+            frames = socket.recv_multipart(zmq.NOBLOCK)
+        except zmq.Again:
+            return requests
+        request = split_request(frames)
+        if request is None:
+            # Not from a REQ client (no envelope delimiter); drop it like REP did
+            print(f"Dropped malformed request: {frames!r}")
+            continue
+        requests.append(request)
+
+def serve_requests(socket, service):
+    """Answer all queued requests, coalescing concurrent READ_PRESSURES onto one hardware read.
+
+    Requests that queue up while a read is in flight attach to that read instead of
+    starting their own, so serial load stays constant as the number of clients grows.
+    """
+    previous_drain = None
+    requests = receive_pending(socket)
+    while requests:
+        drained_at = service.clock()
+        queued_since = previous_drain
+        for envelope, message in requests:
+            print(f"Received request: {message}")
+            response = service.handle_command(message, queued_since)
+            socket.send_multipart(envelope + [response.encode()])
+            if queued_since is None:
+                # Everything else in this batch was queued before the read that just ran
+                queued_since = drained_at
+        previous_drain = drained_at
+        requests = receive_pending(socket)
+
 def main():
     arduino_port = 'COM9'  # Replace with actual Arduino serial port
     tic_port = 'COM20'     # TIC controller port
@@ -150,39 +426,50 @@ def main():
     tic_handler = EdwardsTICReader(tic_port)
 
     context = zmq.Context()
-    socket = context.socket(zmq.REP)
+    # ROUTER instead of REP so every queued request can be answered from one hardware read
+    socket = context.socket(zmq.ROUTER)
     socket.bind("tcp://*:5555")
+    publisher = PressurePublisher(context, config['publish_address'])
+    snapshot = PressureSnapshotWriter()
+    history = HistoryWriter("pressure")
+    profiler = ServerProfiler("pressure_server")
+    profiler.install_signal_handler()
+    loop_timer = profiler.loop_timer
+    service = PressureService(arduino_handler, tic_handler, pressure_json_handler, publisher=publisher,
+                              snapshot=snapshot, history=history, profiler=profiler)
+
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    poller.register(publisher.socket, zmq.POLLIN)  # Subscription messages
 
     print("ZeroMQ Pressure Server listening on port 5555...")
 
     try:
         while True:
-            if socket.poll(timeout=1000) & zmq.POLLIN:
-                message = socket.recv_string()
-                print(f"Received request: {message}")
-
-                if message == "READ_PRESSURES":
-                    # Read from Arduino
-                    arduino_readings = arduino_handler.send_read_command()
-                    # Read from TIC
-                    tic_pressure, tic_unit = tic_handler.get_pressure_reading()
-                    
-                    # Combine readings and write to JSON
-                    if arduino_readings is not None and tic_pressure is not None:
-                        pressure_readings = {**arduino_readings, "Forline": tic_pressure}
-                        pressure_json_handler.write_status(pressure_readings)
-                        response = json.dumps(pressure_readings)
-                    else:
-                        response = "Error: Failed to read pressures"
-                else:
-                    response = "Unknown command"
+            with loop_timer.section("poll"):
+                events = dict(poller.poll(timeout=service.poll_timeout_ms()))
+
+            if publisher.socket in events:
+                with loop_timer.section("subscriptions"):
+                    service.set_subscribers(publisher.drain_subscriptions())
+
+            if socket in events:
+                with loop_timer.section("requests"):
+                    serve_requests(socket, service)
 
-                socket.send_string(response)
+            # Scheduled acquisition at the adaptive per-channel rate
+            with loop_timer.section("acquisition"):
+                service.poll_due()
+            loop_timer.end_iteration()
 
     except KeyboardInterrupt:
         print("Shutting down the server...")
 
     finally:
+        profiler.stop()
+        publisher.close()
+        snapshot.close()
+        history.close()
         socket.close()
         context.term()
         arduino_handler.serial_connection.close()
@@ -0,0 +1,68 @@
+import time
+
+import zmq
+
+class LazyPirateClient:
+    """REQ client that never blocks forever on a dead server (ZeroMQ "Lazy Pirate" pattern).
+
+    Every request is polled with a timeout. On timeout the REQ socket, which is now stuck
+    in its send/receive state machine, is closed and recreated and the request is resent
+    after a bounded exponential backoff.
+    """
+
+    def __init__(self, server_address, context=None, timeout=2500, retries=2,
+                 backoff=0.25, max_backoff=2.0, rtt_smoothing=0.2):
+        self.server_address = server_address
+        self.context = context if context else zmq.Context.instance()
+        self.timeout = timeout  # ms to wait for each reply
+        self.retries = retries  # Resends after the first attempt
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rtt_smoothing = rtt_smoothing
+        self.last_rtt = None  # Seconds
+        self.rtt = None  # Smoothed round-trip time in seconds
+        self.socket = None
+        self.connect()
+
+    def connect(self):
+        """(Re)create the REQ socket."""
+        self.socket = self.context.socket(zmq.REQ)
+        self.socket.setsockopt(zmq.LINGER, 0)  # Drop unsent requests when recycling the socket
+        self.socket.connect(self.server_address)
+
+    def reconnect(self):
+        self.socket.close()
+        self.connect()
+
+    def request(self, message):
+        """Send a request and return (success, reply or error message)."""
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            start = time.monotonic()
+            try:
+                self.socket.send_string(message)
+                if self.socket.poll(timeout=self.timeout) & zmq.POLLIN:
+                    reply = self.socket.recv_string()
+                    self.record_rtt(time.monotonic() - start)
+                    return True, reply
+            except zmq.ZMQError as e:
+                print(f"Error talking to {self.server_address}: {e}")
+
+            # No reply in time: the REQ socket is unusable until it is recreated
+            self.reconnect()
+            if attempt < self.retries:
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+        return False, f"No response from {self.server_address} after {self.retries + 1} attempts"
+
+    def record_rtt(self, rtt):
+        self.last_rtt = rtt
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt = self.rtt_smoothing * rtt + (1 - self.rtt_smoothing) * self.rtt
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
@@ -0,0 +1,114 @@
+import argparse
+import contextlib
+import os
+import re
+import sys
+import tempfile
+import time
+
+from serial_link import TraceReplay, start_replay
+from pressure_reading_server import PressureStatusJSON, SerialPressureHandler, EdwardsTICReader, PressureService
+from valve_serial_command_server import ValveStatusJSON, SerialCommandHandler
+from history_log import HistoryWriter
+
+class ReplayDriver:
+    """Feed a recorded serial trace through the server handlers, persistence included.
+
+    The driver repeatedly looks at the earliest pending recorded write and calls the
+    handler operation that produced it; the handler then consumes the recorded writes
+    and replies of that exchange, including any retries, through its replayed link.
+    History, statistics, deadband and scheduling run on the recorded time of the trace,
+    so replayed records keep their original timestamps at any playback speed.
+    Output files go to a separate directory so production state is never touched.
+    """
+
+    def __init__(self, replay, output_directory):
+        self.replay = replay
+        self.output_directory = output_directory
+        self.pressure_history = HistoryWriter("pressure", output_directory, clock=replay.wall_clock)
+        self.valve_history = HistoryWriter("valves", output_directory, clock=replay.wall_clock)
+        self.pressure_json = PressureStatusJSON(os.path.join(output_directory, "pressure_status.json"))
+        self.pressure_service = PressureService(None, None, self.pressure_json, history=self.pressure_history,
+                                                clock=replay.clock)
+        self.handlers = {}
+        self.exchanges = 0
+
+    def handler_for(self, port, command):
+        """Create the handler that owns a port the first time it is seen in the trace."""
+        if port not in self.handlers:
+            if command == "READ_VOLTAGES":
+                self.handlers[port] = SerialPressureHandler(port, json_handler=self.pressure_json)
+            elif command.startswith("?V"):
+                self.handlers[port] = EdwardsTICReader(port)
+            else:
+                json_handler = ValveStatusJSON(os.path.join(self.output_directory, "valve_status.json"))
+                handler = SerialCommandHandler(port, json_handler=json_handler, history=self.valve_history,
+                                               event_clock=self.replay.wall_clock)
+                # Replay every recorded exchange; never answer from the cached state
+                handler.state_staleness = -1
+                self.handlers[port] = handler
+        return self.handlers[port]
+
+    def dispatch(self, port, command):
+        handler = self.handler_for(port, command)
+        if command == "READ_VOLTAGES":
+            pressure_readings = handler.send_read_command()
+            if pressure_readings is not None:
+                self.pressure_service.update(pressure_readings)
+        elif command.startswith("?V"):
+            tic_pressure, tic_unit = handler.get_pressure_reading()
+            if tic_pressure is not None:
+                self.pressure_service.update({PressureService.TIC_CHANNEL: tic_pressure})
+        elif command == "STATUS_VALVES":
+            handler.reconcile()
+        elif re.match(r'(OPEN|CLOSE)_VALVE_(\d+)', command):
+            handler.execute_command(command)
+
+    def run(self):
+        """Replay the whole trace and return the number of exchanges driven."""
+        while True:
+            pending = self.replay.next_write()
+            if pending is None:
+                return self.exchanges
+            port, data = pending
+            remaining = len(self.replay.writes[port])
+            self.dispatch(port, data.decode(errors="replace").strip())
+            if len(self.replay.writes[port]) == remaining:
+                # Nothing consumed the write (unknown command); skip it to keep going
+                self.replay.writes[port].popleft()
+            self.exchanges += 1
+
+    def close(self):
+        self.pressure_history.close()
+        self.valve_history.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded serial trace through the server pipeline.")
+    parser.add_argument("trace", help="Trace recorded with AP2_SERIAL_TRACE=<path>")
+    speed = parser.add_mutually_exclusive_group()
+    speed.add_argument("--speed", type=float, default=1.0, help="Playback speed factor (default: real time)")
+    speed.add_argument("--fast", action="store_true", help="Replay as fast as possible")
+    parser.add_argument("--output-dir", help="Directory for replayed JSON and history files (default: temporary)")
+    parser.add_argument("--quiet", action="store_true", help="Silence per-exchange handler output")
+    args = parser.parse_args()
+
+    output_directory = args.output_dir or tempfile.mkdtemp(prefix="ap2_replay_")
+    os.makedirs(output_directory, exist_ok=True)
+    replay = TraceReplay(args.trace, speed=None if args.fast else args.speed)
+    recorded_duration = replay.duration()
+    start_replay(replay)
+
+    driver = ReplayDriver(replay, output_directory)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if args.quiet else sys.stdout):
+        exchanges = driver.run()
+    elapsed = time.perf_counter() - start
+    driver.close()
+
+    rate = exchanges / elapsed if elapsed > 0 else float("inf")
+    speedup = recorded_duration / elapsed if elapsed > 0 else float("inf")
+    print(f"Replayed {exchanges} exchanges ({recorded_duration:.1f} s recorded) in {elapsed:.2f} s: "
+          f"{rate:.0f} exchanges/s, {speedup:.1f}x real time. Output in {output_directory}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
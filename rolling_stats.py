@@ -0,0 +1,123 @@
+import math
+import time
+from collections import deque
+
+from pressure_conversion import channel_log_pressure
+
+class RollingWindow:
+    """Statistics of log10 pressure over a sliding time window, updated in amortised O(1) per sample.
+
+    Running sums give the mean and the least-squares slope; monotonic deques give the
+    minimum and maximum. The sums are taken relative to an origin sample, which is moved
+    to the oldest sample in the window (and the sums recomputed from the window) once the
+    old origin is a window length out of date, so rounding error stays bounded with uptime.
+    """
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.samples = deque()
+        self.minima = deque()
+        self.maxima = deque()
+        self.origin = None  # (timestamp, log_pressure) the running sums are relative to
+        self.reset_sums()
+
+    def reset_sums(self):
+        self.sum_t = self.sum_y = self.sum_tt = self.sum_ty = 0.0
+
+    def accumulate(self, timestamp, log_pressure, sign=1.0):
+        t = timestamp - self.origin[0]
+        y = log_pressure - self.origin[1]
+        self.sum_t += sign * t
+        self.sum_y += sign * y
+        self.sum_tt += sign * t * t
+        self.sum_ty += sign * t * y
+
+    def rebase(self):
+        """Move the origin to the oldest sample and recompute the sums from the window."""
+        self.origin = self.samples[0]
+        self.reset_sums()
+        for timestamp, log_pressure in self.samples:
+            self.accumulate(timestamp, log_pressure)
+
+    def add(self, timestamp, log_pressure):
+        if self.origin is None:
+            self.origin = (timestamp, log_pressure)
+        self.samples.append((timestamp, log_pressure))
+        self.accumulate(timestamp, log_pressure)
+
+        while self.minima and self.minima[-1][1] >= log_pressure:
+            self.minima.pop()
+        self.minima.append((timestamp, log_pressure))
+        while self.maxima and self.maxima[-1][1] <= log_pressure:
+            self.maxima.pop()
+        self.maxima.append((timestamp, log_pressure))
+        self.expire(timestamp)
+
+    def expire(self, now):
+        cutoff = now - self.duration
+        while self.samples and self.samples[0][0] < cutoff:
+            self.accumulate(*self.samples.popleft(), sign=-1.0)
+        while self.minima and self.minima[0][0] < cutoff:
+            self.minima.popleft()
+        while self.maxima and self.maxima[0][0] < cutoff:
+            self.maxima.popleft()
+        if not self.samples:
+            self.origin = None
+            self.reset_sums()
+        elif self.samples[0][0] - self.origin[0] > self.duration:
+            # At most once per window length, so the O(n) recomputation is O(1) per sample
+            self.rebase()
+
+    def summary(self):
+        """Return the window statistics in Torr, or None if the window holds no samples."""
+        count = len(self.samples)
+        if count == 0:
+            return None
+        slope = None
+        denominator = count * self.sum_tt - self.sum_t ** 2
+        if count > 1 and denominator > 0:
+            slope = (count * self.sum_ty - self.sum_t * self.sum_y) / denominator
+        latest = self.samples[-1][1]
+        return {
+            "count": count,
+            "min": 10 ** self.minima[0][1],
+            "max": 10 ** self.maxima[0][1],
+            "mean": 10 ** (self.origin[1] + self.sum_y / count),  # Geometric mean, i.e. the mean in log space
+            "slope_decades_per_s": slope,
+            # dp/dt at the latest pressure, the usual rate-of-rise figure for leak checks
+            "rate_of_rise_torr_per_s": None if slope is None else 10 ** latest * math.log(10) * slope
+        }
+
+class RollingStatistics:
+    """Rolling log-pressure statistics per channel over several window lengths."""
+
+    def __init__(self, windows=(10.0, 60.0, 600.0), clock=time.monotonic):
+        self.windows = tuple(windows)
+        self.clock = clock
+        self.channels = {}
+
+    def add(self, channel, value, timestamp=None):
+        """Add a raw reading; readings that do not convert to a pressure are skipped."""
+        log_pressure = channel_log_pressure(channel, value)
+        if log_pressure is None:
+            return
+        timestamp = self.clock() if timestamp is None else timestamp
+        if channel not in self.channels:
+            self.channels[channel] = [RollingWindow(duration) for duration in self.windows]
+        for window in self.channels[channel]:
+            window.add(timestamp, log_pressure)
+
+    def summary(self, channel=None):
+        """Return {channel: {"<window>s": stats}} for one channel or all of them."""
+        now = self.clock()
+        channels = [channel] if channel is not None else list(self.channels)
+        summary = {}
+        for name in channels:
+            windows = self.channels.get(name)
+            if windows is None:
+                continue
+            summary[name] = {}
+            for window in windows:
+                window.expire(now)
+                summary[name][f"{window.duration:g}s"] = window.summary()
+        return summary
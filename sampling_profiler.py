@@ -0,0 +1,169 @@
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+PROFILE_DIRECTORY = "profiles"
+
+# Shared by every disabled LoopTimer section, so timing off allocates nothing per loop
+NO_SECTION = nullcontext()
+
+class SamplingProfiler:
+    """Periodically sample the stacks of every thread and count them as collapsed stacks.
+
+    The output is one "thread;outer_frame;...;inner_frame count" line per distinct stack,
+    the format read by flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.counts.clear()
+        self.samples = 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w") as output:
+            for stack, count in self.counts.most_common():
+                output.write(f"{stack} {count}\n")
+
+class LoopTimer:
+    """Per-iteration timing breakdown of a server loop by named section.
+
+    While disabled, section() costs one flag check and returns a shared no-op context.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.sections = {}  # name -> [count, total, max]
+        self.iterations = [0, 0.0, 0.0]
+        self.iteration_start = None
+
+    def section(self, name):
+        if not self.enabled:
+            return NO_SECTION
+        return self.timed_section(name)
+
+    @contextmanager
+    def timed_section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(self.sections.setdefault(name, [0, 0.0, 0.0]), time.perf_counter() - start)
+
+    def end_iteration(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.iteration_start is not None:
+            self.add(self.iterations, now - self.iteration_start)
+        self.iteration_start = now
+
+    @staticmethod
+    def add(entry, elapsed):
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    @staticmethod
+    def describe(entry):
+        count, total, longest = entry
+        return {"count": count, "total_s": total, "mean_s": total / count if count else None, "max_s": longest}
+
+    def summary(self):
+        return {
+            "iteration": self.describe(self.iterations),
+            "sections": {name: self.describe(entry) for name, entry in self.sections.items()}
+        }
+
+class ServerProfiler:
+    """Runtime-toggleable profiling for a server: PROFILE START/STOP/STATUS commands or SIGUSR1."""
+
+    def __init__(self, name, loop_timer=None, interval=0.005, directory=PROFILE_DIRECTORY):
+        self.name = name
+        self.loop_timer = loop_timer if loop_timer else LoopTimer()
+        self.sampler = SamplingProfiler(interval)
+        self.directory = directory
+
+    def install_signal_handler(self):
+        """Toggle profiling on SIGUSR1 where the platform has it (not on Windows)."""
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: print(self.toggle()))
+
+    def start(self):
+        if self.sampler.running:
+            return "Profiling already running"
+        self.loop_timer.reset()
+        self.loop_timer.enabled = True
+        self.sampler.start()
+        return "Profiling started"
+
+    def stop(self):
+        """Stop profiling and dump the collapsed stacks and loop timings; return a reply."""
+        if not self.sampler.running:
+            return "Profiling not running"
+        self.sampler.stop()
+        self.loop_timer.enabled = False
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory, f"{self.name}_{time.strftime('%Y%m%d_%H%M%S')}")
+        self.sampler.write_collapsed(f"{stem}.folded")
+        with open(f"{stem}.timing.json", "w") as timing_file:
+            json.dump(self.loop_timer.summary(), timing_file, indent=4)
+        return f"Profiling stopped: {self.sampler.samples} samples in {stem}.folded, timings in {stem}.timing.json"
+
+    def toggle(self):
+        return self.stop() if self.sampler.running else self.start()
+
+    def handle_command(self, arguments):
+        """Handle the arguments of a PROFILE command and return the reply."""
+        action = arguments[0].upper() if arguments else "STATUS"
+        if action == "START":
+            return self.start()
+        if action == "STOP":
+            return self.stop()
+        if action == "STATUS":
+            return "Profiling running" if self.sampler.running else "Profiling not running"
+        return "Error: Usage: PROFILE START|STOP|STATUS"
@@ -0,0 +1,212 @@
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import serial
+
+# Trace file layout: MAGIC, then records of RECORD header + payload.
+# Kinds: b"T" holds the wall-clock start time (a WALL_TIME payload), b"P" declares the port
+# name for a port index, b"W" is a write, b"R" a readline.
+TRACE_MAGIC = b"AP2TRACE1\n"
+RECORD = struct.Struct("<dcBH")  # seconds since trace start (monotonic), kind, port index, payload length
+WALL_TIME = struct.Struct("<d")
+
+# Set AP2_SERIAL_TRACE to a file path to record every serial exchange of the process
+TRACE_ENV = "AP2_SERIAL_TRACE"
+
+class TraceRecorder:
+    """Append serial exchanges with monotonic timestamps to a compact binary trace file.
+
+    Every record is flushed to the OS right away: servers are stopped with SIGKILL, so
+    anything still buffered in the process would be lost, and the last exchanges before
+    an incident are the ones that matter.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(TRACE_MAGIC)
+        self.start = time.monotonic()
+        self.file.write(RECORD.pack(0.0, b"T", 0, WALL_TIME.size) + WALL_TIME.pack(time.time()))
+        self.ports = {}
+        self.lock = threading.Lock()  # Handlers may run on different threads (gateway)
+
+    def record(self, port, kind, data):
+        with self.lock:
+            elapsed = time.monotonic() - self.start
+            if port not in self.ports:
+                self.ports[port] = len(self.ports)
+                name = port.encode()
+                self.file.write(RECORD.pack(elapsed, b"P", self.ports[port], len(name)) + name)
+            self.file.write(RECORD.pack(elapsed, kind, self.ports[port], len(data)) + data)
+            self.file.flush()
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def read_trace(path):
+    """Yield (elapsed, kind, port, data) records from a trace file; port is None for b"T"."""
+    ports = {}
+    with open(path, "rb") as trace_file:
+        if trace_file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a serial trace file.")
+        while True:
+            header = trace_file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            elapsed, kind, index, length = RECORD.unpack(header)
+            data = trace_file.read(length)
+            if kind == b"P":
+                ports[index] = data.decode()
+            elif kind == b"T":
+                yield elapsed, kind, None, data
+            else:
+                yield elapsed, kind, ports[index], data
+
+class SerialLink:
+    """Serial port used by the pressure and valve handlers, optionally recording every exchange."""
+
+    def __init__(self, port, baudrate=9600, timeout=1, recorder=None):
+        self.port = port
+        self.connection = serial.Serial(port, baudrate, timeout=timeout)
+        self.recorder = recorder
+
+    @property
+    def is_open(self):
+        return self.connection.is_open
+
+    def write(self, data):
+        written = self.connection.write(data)
+        if self.recorder:
+            self.recorder.record(self.port, b"W", data)
+        return written
+
+    def readline(self):
+        data = self.connection.readline()
+        if self.recorder:
+            self.recorder.record(self.port, b"R", data)
+        return data
+
+    def settle(self, seconds):
+        """Give the device time to answer; replayed links skip this."""
+        time.sleep(seconds)
+
+    def close(self):
+        if self.recorder:
+            self.recorder.flush()
+        self.connection.close()
+
+class TraceReplay:
+    """Serve recorded serial traffic back to the handlers, per port and in recorded order.
+
+    The replay also keeps the recorded time of the last exchange served, so components
+    that timestamp, filter or rate readings can run on trace time instead of the wall
+    clock: clock() is a monotonic clock and wall_clock() the recorded wall-clock time.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed  # Playback speed factor; None replays as fast as possible
+        self.writes = {}
+        self.reads = {}
+        self.wall_start = None
+        for elapsed, kind, port, data in read_trace(path):
+            if kind == b"T":
+                self.wall_start = WALL_TIME.unpack(data)[0]
+                continue
+            queue = self.writes if kind == b"W" else self.reads
+            queue.setdefault(port, deque()).append((elapsed, data))
+        if self.wall_start is None:
+            # Traces without a start record: the file was last written at the end of the trace
+            self.wall_start = os.path.getmtime(path) - self.duration()
+        self.start = None
+        self.position = 0.0  # Recorded time of the latest exchange served
+
+    def duration(self):
+        return max((queue[-1][0] for queue in list(self.writes.values()) + list(self.reads.values()) if queue),
+                   default=0.0)
+
+    def advance(self, elapsed):
+        self.position = max(self.position, elapsed)
+
+    def clock(self):
+        return self.position
+
+    def wall_clock(self):
+        return self.wall_start + self.position
+
+    def open(self, port):
+        if self.start is None:
+            self.start = time.monotonic()
+        return ReplaySerialLink(self, port)
+
+    def wait_until(self, elapsed):
+        """Block until a recorded time offset is reached at the playback speed."""
+        if self.speed:
+            delay = self.start + elapsed / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def next_write(self):
+        """Return (port, data) of the earliest pending recorded write, or None when done."""
+        pending = [(queue[0][0], port) for port, queue in self.writes.items() if queue]
+        if not pending:
+            return None
+        elapsed, port = min(pending)
+        return port, self.writes[port][0][1]
+
+class ReplaySerialLink:
+    """Stand-in for SerialLink that answers from a TraceReplay instead of hardware."""
+
+    def __init__(self, replay, port):
+        self.replay = replay
+        self.port = port
+        self.is_open = True
+
+    def write(self, data):
+        queue = self.replay.writes.get(self.port)
+        if queue:
+            elapsed, recorded = queue.popleft()
+            self.replay.advance(elapsed)
+            if recorded != data:
+                print(f"Replay mismatch on {self.port}: wrote {data!r}, trace has {recorded!r}")
+        return len(data)
+
+    def readline(self):
+        queue = self.replay.reads.get(self.port)
+        if not queue:
+            return b""
+        elapsed, data = queue.popleft()
+        self.replay.wait_until(elapsed)
+        self.replay.advance(elapsed)
+        return data
+
+    def settle(self, seconds):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+# Module-level recorder/replay shared by every handler in the process
+_recorder = None
+_replay = None
+
+def start_replay(replay):
+    """Make open_link() hand out replayed links instead of opening hardware ports."""
+    global _replay
+    _replay = replay
+
+def open_link(port, baudrate=9600, timeout=1):
+    """Open a serial link, recording it if AP2_SERIAL_TRACE is set or replaying if a replay is active."""
+    global _recorder
+    if _replay is not None:
+        return _replay.open(port)
+    if _recorder is None and os.environ.get(TRACE_ENV):
+        _recorder = TraceRecorder(os.environ[TRACE_ENV])
+        print(f"Recording serial traffic to {os.environ[TRACE_ENV]}")
+    return SerialLink(port, baudrate, timeout=timeout, recorder=_recorder)
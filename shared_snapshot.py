@@ -0,0 +1,103 @@
+import math
+import struct
+import time
+from multiprocessing import shared_memory
+
+SNAPSHOT_NAME = "ap2_pressure_snapshot"
+
+# Fixed channel order of the snapshot slots
+SNAPSHOT_CHANNELS = ("A0", "A1", "A2", "A3", "Forline")
+
+# Layout: header (sequence counter, channel count) followed by one (timestamp, value) slot per channel.
+# The sequence counter is odd while the writer is updating the slots (seqlock).
+HEADER = struct.Struct("<QI4x")
+SLOT = struct.Struct("<dd")
+SNAPSHOT_SIZE = HEADER.size + SLOT.size * len(SNAPSHOT_CHANNELS)
+
+def untrack_segment(segment):
+    """Stop the resource tracker from unlinking a segment this process only attached to."""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+
+class PressureSnapshotWriter:
+    """Publish the latest pressure readings into a fixed-layout shared memory segment."""
+
+    def __init__(self, name=SNAPSHOT_NAME):
+        try:
+            self.segment = shared_memory.SharedMemory(name=name, create=True, size=SNAPSHOT_SIZE)
+        except FileExistsError:
+            # Left behind by a server that did not shut down cleanly; take it over
+            self.segment = shared_memory.SharedMemory(name=name)
+        self.buffer = self.segment.buf
+        self.sequence = HEADER.unpack_from(self.buffer, 0)[0] & ~1
+        self.slots = {channel: (0.0, math.nan) for channel in SNAPSHOT_CHANNELS}
+        self.flush()
+
+    def write(self, pressure_readings, timestamp=None):
+        """Update the slots of the given channels; other channels keep their last value."""
+        timestamp = time.time() if timestamp is None else timestamp
+        for channel, value in pressure_readings.items():
+            if channel in self.slots:
+                self.slots[channel] = (timestamp, math.nan if value is None else float(value))
+        self.flush()
+
+    def flush(self):
+        # Odd sequence marks the write in progress; readers retry until it is even and unchanged
+        HEADER.pack_into(self.buffer, 0, self.sequence + 1, len(SNAPSHOT_CHANNELS))
+        for index, channel in enumerate(SNAPSHOT_CHANNELS):
+            SLOT.pack_into(self.buffer, HEADER.size + index * SLOT.size, *self.slots[channel])
+        self.sequence += 2
+        HEADER.pack_into(self.buffer, 0, self.sequence, len(SNAPSHOT_CHANNELS))
+
+    def close(self, unlink=True):
+        self.buffer = None
+        self.segment.close()
+        if unlink:
+            try:
+                self.segment.unlink()
+            except FileNotFoundError:
+                pass
+
+class PressureSnapshotReader:
+    """Lock-free reader of the pressure snapshot for processes on the same host."""
+
+    def __init__(self, name=SNAPSHOT_NAME):
+        try:
+            # Python 3.13+: attach without registering with the resource tracker
+            self.segment = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            self.segment = shared_memory.SharedMemory(name=name)
+            untrack_segment(self.segment)
+        self.buffer = self.segment.buf
+
+    def read(self, max_retries=1000):
+        """Return (sequence, {channel: (timestamp, value)}) with the raw readings the server sends.
+
+        Values are Arduino volts or TIC Pa, or None if the channel was never read. An ion
+        gauge that is off is not None but reads 5 V or more; use channel_pressure() from
+        pressure_conversion to get Torr (None when off). Raises RuntimeError if no
+        consistent snapshot could be read within max_retries.
+        """
+        for attempt in range(max_retries):
+            sequence, count = HEADER.unpack_from(self.buffer, 0)
+            if sequence & 1:
+                continue
+            slots = [SLOT.unpack_from(self.buffer, HEADER.size + index * SLOT.size)
+                     for index in range(min(count, len(SNAPSHOT_CHANNELS)))]
+            if HEADER.unpack_from(self.buffer, 0)[0] == sequence:
+                return sequence, {
+                    channel: (timestamp, None if math.isnan(value) else value)
+                    for channel, (timestamp, value) in zip(SNAPSHOT_CHANNELS, slots)
+                }
+        raise RuntimeError("Could not read a consistent pressure snapshot.")
+
+    def read_values(self):
+        """Return {channel: value} of the latest snapshot."""
+        return {channel: value for channel, (timestamp, value) in self.read()[1].items()}
+
+    def close(self):
+        self.buffer = None
+        self.segment.close()
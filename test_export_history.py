@@ -0,0 +1,55 @@
+import csv
+import math
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pyarrow")
+
+import export_history
+from history_log import PRESSURE_COLUMNS, history_path
+
+START = 1767225600.0  # 2026-01-01 00:00 UTC
+
+# Deadband-filtered records: unchanged channels are left empty, 5.2 V is an ion gauge that is off
+RECORDS = [
+    (START + 1.0, "1.5000", "2.0000", "", "4.5000", "12.5"),
+    (START + 2.5, "", "5.2000", "3.0000", "", ""),
+    (START + 4.0, "1.7500", "", "", "", "0"),
+    (START + 9.0, "", "", "", "5.2000", "101325"),
+    (START + 9.5, "0.5000", "2.2500", "", "", ""),
+]
+
+def load(path):
+    with open(path, newline="") as output_file:
+        reader = csv.reader(output_file)
+        header = next(reader)
+        return header, [[float(value) if value else None for value in row] for row in reader]
+
+def same(value, other):
+    if value is None or other is None:
+        return value is None and other is None
+    return math.isclose(value, other, rel_tol=1e-12)
+
+@pytest.mark.parametrize("interval", [None, 2.0])
+@pytest.mark.parametrize("convert", [True, False])
+def test_columnar_export_matches_row_export(tmp_path, monkeypatch, interval, convert):
+    with open(history_path(tmp_path, "pressure", "2026-01-01"), "w", newline="") as history_file:
+        writer = csv.writer(history_file)
+        writer.writerow(PRESSURE_COLUMNS)
+        writer.writerows(RECORDS)
+
+    columnar_output = tmp_path / "columnar.csv"
+    row_output = tmp_path / "rows.csv"
+    export_history.export_history("pressure", START, START + 60, columnar_output, directory=tmp_path,
+                                  interval=interval, convert=convert)
+    monkeypatch.setattr(export_history, "columnar_modules", lambda: None)
+    export_history.export_history("pressure", START, START + 60, row_output, directory=tmp_path,
+                                  interval=interval, convert=convert)
+
+    columnar_header, columnar_rows = load(columnar_output)
+    row_header, rows = load(row_output)
+    assert columnar_header == row_header == list(PRESSURE_COLUMNS)
+    assert len(columnar_rows) == len(rows) > 0
+    for columnar_row, row in zip(columnar_rows, rows):
+        assert all(same(value, other) for value, other in zip(columnar_row, row)), (columnar_row, row)
@@ -0,0 +1,28 @@
+from polling_scheduler import AdaptivePollingScheduler
+
+def run_until(scheduler, clock, end, reading):
+    """Poll every due channel until end, feeding reading(channel, now) to the scheduler."""
+    while clock[0] < end:
+        clock[0] += scheduler.time_until_next()
+        for channel in scheduler.due_channels():
+            scheduler.record(channel, reading(channel, clock[0]))
+
+def test_gauge_switching_off_releases_the_floor():
+    clock = [0.0]
+    scheduler = AdaptivePollingScheduler(["A0"], thresholds={"A0": 1e-5}, clock=lambda: clock[0])
+    # Ion gauge rising fast towards its threshold (A0: log10 p = 2 V - 11) ...
+    run_until(scheduler, clock, 4.0, lambda channel, now: 2.5 + 0.1 * now)
+    assert scheduler.interval("A0") == scheduler.floor_interval
+    # ... then tripping off-scale for the rest of the vent
+    run_until(scheduler, clock, 40.0, lambda channel, now: 5.1)
+    assert scheduler.interval("A0") == scheduler.ceiling_interval
+
+def test_steady_reading_past_threshold_is_not_polled_at_the_floor():
+    clock = [0.0]
+    scheduler = AdaptivePollingScheduler(["Forline"], thresholds={"Forline": 1e-1}, clock=lambda: clock[0])
+    # Forline at atmosphere (Pa) for the whole vent
+    run_until(scheduler, clock, 60.0, lambda channel, now: 101325.0)
+    assert scheduler.interval("Forline") == scheduler.past_threshold_interval
+    # A reading still moving past the threshold is polled at the rate limit
+    run_until(scheduler, clock, 70.0, lambda channel, now: 101325.0 * 10 ** (-0.2 * (now - 60.0)))
+    assert scheduler.interval("Forline") == scheduler.floor_interval
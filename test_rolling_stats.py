@@ -0,0 +1,27 @@
+import math
+
+from rolling_stats import RollingWindow
+
+def test_slope_stays_accurate_after_long_uptime():
+    # 5 Hz samples for three days in a 10 s window, rising at a known rate
+    window = RollingWindow(10.0)
+    slope = 1e-4
+    samples = 3 * 86400 * 5
+    for index in range(samples):
+        timestamp = index * 0.2
+        window.add(timestamp, -9.0 + slope * (timestamp % 3600.0))
+    summary = window.summary()
+    assert summary["count"] == 51
+    assert math.isclose(summary["slope_decades_per_s"], slope, rel_tol=1e-9)
+
+def test_window_statistics():
+    window = RollingWindow(10.0)
+    for timestamp, log_pressure in ((0.0, -8.0), (5.0, -6.0), (10.0, -7.0), (15.0, -9.0)):
+        window.add(timestamp, log_pressure)
+    summary = window.summary()
+    # The sample at 0 s has left the window
+    assert summary["count"] == 3
+    assert math.isclose(summary["min"], 1e-9)
+    assert math.isclose(summary["max"], 1e-6)
+    assert math.isclose(summary["mean"], 10 ** (-22 / 3))  # Geometric mean
+    assert math.isclose(summary["slope_decades_per_s"], -0.3)
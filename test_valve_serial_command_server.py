@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+pytest.importorskip("zmq")
+pytest.importorskip("serial")
+
+from valve_serial_command_server import SerialCommandHandler, ValveStatusJSON
+
+STATUS_REPLY = ("VALVE_STATUS: Valve_1=CLOSED, Valve_2=CLOSED, Valve_3=CLOSED, "
+                "Valve_4=CLOSED, Valve_5=CLOSED, Valve_6=CLOSED")
+
+class FakeLink:
+    """Serial link answering each command from a {command: [reply lines]} table."""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.pending = []
+        self.writes = []
+        self.is_open = True
+
+    def write(self, data):
+        command = data.decode().strip()
+        self.writes.append(command)
+        self.pending = list(self.replies.get(command, []))
+        return len(data)
+
+    def readline(self):
+        return (self.pending.pop(0) + "\n").encode() if self.pending else b""
+
+    def settle(self, seconds):
+        pass
+
+def make_handler(tmp_path, replies):
+    status_file = tmp_path / "valve_status.json"
+    status_file.write_text(json.dumps({"status": {f"VALVE_{i}": "CLOSED" for i in range(1, 9)}}))
+    handler = SerialCommandHandler("NO_SUCH_PORT", json_handler=ValveStatusJSON(str(status_file)))
+    handler.serial_connection = FakeLink(replies)
+    return handler
+
+def test_valves_missing_from_status_reply_are_not_short_circuited(tmp_path):
+    handler = make_handler(tmp_path, {
+        "STATUS_VALVES": ["CMD_RECEIVED=STATUS_VALVES", STATUS_REPLY],
+        "CLOSE_VALVE_2": ["VALVE_ALREADY_CLOSED"],
+        "CLOSE_VALVE_7": ["VALVE_ALREADY_CLOSED"],
+    })
+    handler.reconcile()
+    link = handler.serial_connection
+    link.writes.clear()
+
+    # Valve 2 was just reported closed, so no serial round trip is needed
+    assert handler.execute_command("CLOSE_VALVE_2") == "Valve 2 is already closed."
+    assert link.writes == []
+    # Valve 7 is only known from the JSON file and must be checked with the Arduino
+    assert handler.execute_command("CLOSE_VALVE_7") == "Valve 7 is already closed."
+    assert link.writes == ["CLOSE_VALVE_7"]
+
+def test_actuation_confirms_only_the_actuated_valve(tmp_path):
+    handler = make_handler(tmp_path, {
+        "OPEN_VALVE_3": ["SUCCESS"],
+        "CLOSE_VALVE_5": ["SUCCESS"],
+    })
+    # Reconciliation fails: the status query gets no reply
+    assert handler.reconcile() == []
+    assert handler.execute_command("OPEN_VALVE_3") == "Command OPEN executed for Valve 3"
+    link = handler.serial_connection
+    link.writes.clear()
+
+    assert handler.execute_command("OPEN_VALVE_3") == "Valve 3 is already open."
+    assert link.writes == []
+    assert handler.execute_command("CLOSE_VALVE_5") == "Command CLOSE executed for Valve 5"
+    assert link.writes == ["CLOSE_VALVE_5"]
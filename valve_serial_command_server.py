@@ -219,9 +219,22 @@
 
 import zmq
 import json
-import serial
 import time
 import re
+from collections import OrderedDict
+
+from valve_state import ValveState, OPEN, CLOSED, normalize_valve_name
+from history_log import HistoryWriter
+from serial_link import open_link
+from sampling_profiler import ServerProfiler
+
+# Configuration dictionary for the valve server
+config = {
+    'publish_address': "tcp://*:5561",  # Valve change events
+    'reconcile_interval': 5.0,          # Seconds between background STATUS_VALVES queries
+    'state_staleness': 10.0,            # Cached state younger than this (s) may answer OPEN/CLOSE directly
+    'request_id_cache_size': 256        # Replies remembered for deduplicating retried requests
+}
 
 class ValveStatusJSON:
     def __init__(self, json_file="valve_status.json"):
@@ -240,10 +253,18 @@ class ValveStatusJSON:
             print(f"Error reading JSON: {e}")
             return None
 
+    def read_state(self):
+        """Read the valve status from the JSON file as a canonical ValveState."""
+        data = self.read_status() or {}
+        return ValveState.from_dict(data.get("status", {}))
+
     def write_status(self, valve_status):
         """Write the valve status along with a timestamp to the JSON file."""
+        if not isinstance(valve_status, ValveState):
+            valve_status = ValveState.from_dict(valve_status)
         data = {
-            "status": valve_status,
+            "status": valve_status.to_dict(),
+            "bitmask": valve_status.encode(),
             "timestamp": time.time()  # Current timestamp
         }
         try:
@@ -270,19 +291,44 @@ class ValveStatusJSON:
             "timestamp": time.time()  # Set timestamp for initialization
         }
 
+class ValveEventPublisher:
+    """PUB socket that streams valve change events."""
+
+    def __init__(self, context, address):
+        self.socket = context.socket(zmq.PUB)
+        self.socket.bind(address)
+
+    def publish(self, event):
+        self.socket.send_string(f"VALVE_EVENT {json.dumps(event)}")
+
+    def close(self):
+        self.socket.close()
+
 class SerialCommandHandler:
-    def __init__(self, serial_port, baudrate=9600, json_handler=None):
+    def __init__(self, serial_port, baudrate=9600, json_handler=None, event_publisher=None, history=None,
+                 profiler=None, event_clock=time.time):
         self.serial_port = serial_port
         self.baudrate = baudrate
         self.serial_connection = None
         self.json_handler = json_handler if json_handler else ValveStatusJSON()
+        self.event_publisher = event_publisher
+        self.history = history
+        self.profiler = profiler
+        self.event_clock = event_clock  # Wall clock that timestamps change events
+        # Cached valve state, and per valve the monotonic time the Arduino last confirmed it;
+        # valves only read back from the JSON file have no entry and are never fresh
+        self.valve_state = self.json_handler.read_state()
+        self.confirmed_at = {}
+        self.state_staleness = config['state_staleness']
+        # request_id -> reply, oldest first
+        self.recent_replies = OrderedDict()
         self.init_serial_connection()
 
     def init_serial_connection(self):
         """Initialize the serial connection."""
         try:
-            self.serial_connection = serial.Serial(self.serial_port, self.baudrate, timeout=1)
-            time.sleep(2)  # Short delay to ensure the connection is ready
+            self.serial_connection = open_link(self.serial_port, self.baudrate, timeout=1)
+            self.serial_connection.settle(2)  # Short delay to ensure the connection is ready
             print(f"Connected to serial port {self.serial_port}")
         except Exception as e:
             print(f"Error connecting to serial port: {e}")
@@ -294,7 +340,7 @@ class SerialCommandHandler:
             if self.serial_connection and self.serial_connection.is_open:
                 try:
                     self.serial_connection.write(f"{command}\n".encode())
-                    time.sleep(0.1)  # Small delay to give Arduino time to process
+                    self.serial_connection.settle(0.1)  # Small delay to give Arduino time to process
                     response = self.serial_connection.readline().decode().strip()
                     if response:  # Check if a response is received
                         print(f"Sent: {command}, Received: {response}")
@@ -305,27 +351,119 @@ class SerialCommandHandler:
                 print("Serial connection not open.")
             
             attempt += 1
-            time.sleep(1)  # Short delay between retries
+            if attempt < retries:
+                # Short delay between retries; replayed links skip it
+                if self.serial_connection:
+                    self.serial_connection.settle(1)
+                else:
+                    time.sleep(1)
         return None  # Return None if all attempts fail
 
-    def handle_command(self, command):
+    def query_valve_status(self, retries=3):
+        """Ask the Arduino for the valve statuses and return them as normalized {name: status}."""
+        response = self.send_command_to_arduino("STATUS_VALVES", retries=retries)
+
+        if response and "CMD_RECEIVED=STATUS_VALVES" in response:
+            # Wait for the next line which contains the actual valve status
+            self.serial_connection.settle(0.1)  # Small delay before reading again
+            response = self.serial_connection.readline().decode().strip()
+
+        if response and "VALVE_STATUS:" in response:
+            # Normalize the Arduino's valve names once, here at the protocol boundary
+            return ValveState.parse_status_line(response)
+        return None
+
+    def update_state(self, valve_state, confirmed):
+        """Adopt a state from the Arduino; persist and publish an event per changed valve.
+
+        confirmed names the valves the Arduino actually reported or actuated; only those
+        are marked as freshly confirmed.
+        """
+        timestamp = self.event_clock()
+        events = [
+            {"valve": valve, "old": old, "new": new, "timestamp": timestamp}
+            for valve, old, new in self.valve_state.diff(valve_state)
+        ]
+        now = time.monotonic()
+        for valve in confirmed:
+            self.confirmed_at[valve] = now
+        if events:
+            self.valve_state = valve_state
+            self.json_handler.write_status(valve_state)
+            for event in events:
+                if self.history:
+                    self.history.append(event, event["timestamp"])
+                if self.event_publisher:
+                    self.event_publisher.publish(event)
+        return events
+
+    def reconcile(self):
+        """Refresh the cached state from the Arduino and return the resulting change events.
+
+        Runs in the background, so a single attempt is made: retrying an absent Arduino
+        would block request handling for seconds on every pass.
+        """
+        try:
+            valve_updates = self.query_valve_status(retries=1)
+        except Exception as e:
+            print(f"Error reconciling valve status: {e}")
+            return []
+        if valve_updates is None:
+            return []
+        return self.update_state(self.valve_state.merge(valve_updates), valve_updates)
+
+    def is_state_fresh(self, valve):
+        """Return True if the Arduino confirmed this valve's cached state within the staleness bound."""
+        confirmed = self.confirmed_at.get(valve)
+        return confirmed is not None and time.monotonic() - confirmed <= self.state_staleness
+
+    def handle_command(self, message):
+        """Handle a request, replaying the earlier reply if its request ID was already handled.
+
+        A request may carry an ID as a trailing "ID=<request_id>" token, e.g. "OPEN_VALVE_3 ID=42",
+        so that a client retrying after a lost reply does not actuate twice.
+        """
+        match = re.fullmatch(r'(.*?)\s+ID=(\S+)\s*', message)
+        if not match:
+            return self.execute_command(message)
+
+        command, request_id = match.groups()
+        if request_id in self.recent_replies:
+            self.recent_replies.move_to_end(request_id)
+            return self.recent_replies[request_id]
+
+        response = self.execute_command(command)
+        self.recent_replies[request_id] = response
+        while len(self.recent_replies) > config['request_id_cache_size']:
+            self.recent_replies.popitem(last=False)
+        return response
+
+    def execute_command(self, command):
         """Handle the incoming command: open/close valves or get status."""
         try:
-            # Read the current valve status from the JSON file
-            valve_status = self.json_handler.read_status().get("status", {})
-
             # Match OPEN_VALVE_n or CLOSE_VALVE_n commands using re.match
             match = re.match(r'(OPEN|CLOSE)_VALVE_(\d+)', command)
 
             if match:
                 action, valve_number = match.groups()
-                valve_key = f"VALVE_{valve_number}"
+                valve_key = normalize_valve_name(valve_number)
+                if valve_key is None:
+                    return f"Error: Unknown valve {valve_number}"
+
+                # Idempotent short-circuit: a freshly confirmed valve state already matching
+                # the request is answered without a serial round trip
+                if self.is_state_fresh(valve_key):
+                    if action == "OPEN" and self.valve_state.status(valve_key) == OPEN:
+                        return f"Valve {valve_number} is already open."
+                    if action == "CLOSE" and self.valve_state.status(valve_key) == CLOSED:
+                        return f"Valve {valve_number} is already closed."
 
                 if action == "OPEN":
                     response = self.send_command_to_arduino(f"OPEN_VALVE_{valve_number}")
                     if response and "SUCCESS" in response:
-                        valve_status[valve_key] = "OPEN"
+                        self.update_state(self.valve_state.with_status(valve_key, OPEN), [valve_key])
                     elif response and "VALVE_ALREADY_OPEN" in response:
+                        self.update_state(self.valve_state.with_status(valve_key, OPEN), [valve_key])
                         return f"Valve {valve_number} is already open."
                     else:
                         return f"Error: {response or 'No response'}"
@@ -333,42 +471,30 @@ class SerialCommandHandler:
                 elif action == "CLOSE":
                     response = self.send_command_to_arduino(f"CLOSE_VALVE_{valve_number}")
                     if response and "SUCCESS" in response:
-                        valve_status[valve_key] = "CLOSED"
+                        self.update_state(self.valve_state.with_status(valve_key, CLOSED), [valve_key])
                     elif response and "VALVE_ALREADY_CLOSED" in response:
+                        self.update_state(self.valve_state.with_status(valve_key, CLOSED), [valve_key])
                         return f"Valve {valve_number} is already closed."
                     else:
                         return f"Error: {response or 'No response'}"
 
-                self.json_handler.write_status(valve_status)
                 return f"Command {action} executed for Valve {valve_number}"
 
             elif command == "STATUS_VALVES":
-                # Send the STATUS_VALVES command to Arduino
-                response = self.send_command_to_arduino("STATUS_VALVES")
-                print(f"First response: {response}")  # Debugging output
+                try:
+                    valve_updates = self.query_valve_status()
+                except ValueError as e:
+                    return f"Error: {e}"
 
-                if response and "CMD_RECEIVED=STATUS_VALVES" in response:
-                    # Wait for the next line which contains the actual valve status
-                    time.sleep(0.1)  # Small delay before reading again
-                    response = self.serial_connection.readline().decode().strip()
-                    print(f"Valve status response: {response}")  # Debugging output
-
-                if response and "VALVE_STATUS:" in response:
-                    response = response.replace("VALVE_STATUS:", "").strip()
-                    valve_updates = response.split(", ")
-                    for update in valve_updates:
-                        if "=" in update:
-                            try:
-                                valve, status = update.split("=")
-                                valve_status[valve.strip()] = status.strip()
-                            except ValueError:
-                                return f"Error: Invalid valve status format: {update}"
-
-                    self.json_handler.write_status(valve_status)
-                    return f"VALVE_STATUS: {response}"
+                if valve_updates is not None:
+                    self.update_state(self.valve_state.merge(valve_updates), valve_updates)
+                    return f"VALVE_STATUS: {self.valve_state.to_status_line()}"
                 else:
                     return "Error: Failed to retrieve valve statuses"
 
+            elif command.split()[:1] == ["PROFILE"] and self.profiler:
+                return self.profiler.handle_command(command.split()[1:])
+
             else:
                 return "Unknown command"
 
@@ -378,11 +504,18 @@ class SerialCommandHandler:
 def main():
     serial_port = 'COM10'  # Replace with your actual serial port on Windows
     valve_json_handler = ValveStatusJSON()  # Instantiate the ValveStatusJSON class
-    handler = SerialCommandHandler(serial_port, json_handler=valve_json_handler)
 
     context = zmq.Context()
     socket = context.socket(zmq.REP)  # REP socket for synchronous communication
     socket.bind("tcp://*:5560")  # Bind to TCP port 5555
+    event_publisher = ValveEventPublisher(context, config['publish_address'])
+    history = HistoryWriter("valves")
+    profiler = ServerProfiler("valve_server")
+    profiler.install_signal_handler()
+    loop_timer = profiler.loop_timer
+    handler = SerialCommandHandler(serial_port, json_handler=valve_json_handler, event_publisher=event_publisher,
+                                   history=history, profiler=profiler)
+    last_reconcile = float("-inf")
 
     poller = zmq.Poller()
     poller.register(socket, zmq.POLLIN)  # Register the socket for incoming messages
@@ -391,23 +524,35 @@ def main():
 
     try:
         while True:
-            events = dict(poller.poll(timeout=1000))  # Timeout set to 1000ms (1 second)
+            with loop_timer.section("poll"):
+                events = dict(poller.poll(timeout=1000))  # Timeout set to 1000ms (1 second)
 
             if socket in events:
-                message = socket.recv_string()
-                print(f"Received request: {message}")
+                with loop_timer.section("requests"):
+                    message = socket.recv_string()
+                    print(f"Received request: {message}")
+
+                    # Handle the command (send it to Arduino and update JSON as needed)
+                    response = handler.handle_command(message)
 
-                # Handle the command (send it to Arduino and update JSON as needed)
-                response = handler.handle_command(message)
+                    # Send the reply back to the client
+                    socket.send_string(response)
 
-                # Send the reply back to the client
-                socket.send_string(response)
+            # Background reconciliation catches manual overrides and firmware-side interlocks
+            if time.monotonic() - last_reconcile >= config['reconcile_interval']:
+                with loop_timer.section("reconcile"):
+                    handler.reconcile()
+                last_reconcile = time.monotonic()
+            loop_timer.end_iteration()
 
     except KeyboardInterrupt:
         print("\nShutting down the server...")
 
     finally:
         # Close the socket and context properly
+        profiler.stop()
+        event_publisher.close()
+        history.close()
         socket.close()
         context.term()
         if handler.serial_connection and handler.serial_connection.is_open:
@@ -0,0 +1,127 @@
+import re
+
+# Fixed valve order: bit i of a mask describes VALVE_NAMES[i]
+VALVE_NAMES = tuple(f"VALVE_{i}" for i in range(1, 9))
+VALVE_INDEX = {name: index for index, name in enumerate(VALVE_NAMES)}
+
+OPEN = "OPEN"
+CLOSED = "CLOSED"
+UNKNOWN = "UNKNOWN"
+
+def normalize_valve_name(name):
+    """Map any valve spelling ("Valve_3", "valve 3", "VALVE_3", "3") to its canonical name."""
+    match = re.fullmatch(r'\s*(?:valve[_\s]*)?(\d+)\s*', str(name), re.IGNORECASE)
+    if not match:
+        return None
+    canonical = f"VALVE_{int(match.group(1))}"
+    return canonical if canonical in VALVE_INDEX else None
+
+def normalize_valve_status(status):
+    """Map a reported status onto OPEN, CLOSED or UNKNOWN."""
+    status = str(status).strip().upper()
+    if status in ("OPEN", "OPENED"):
+        return OPEN
+    if status in ("CLOSED", "CLOSE"):
+        return CLOSED
+    return UNKNOWN
+
+class ValveState:
+    """Immutable valve state held as two bitmasks over VALVE_NAMES.
+
+    A valve is known if its bit is set in known_mask, and open if its bit is also set in
+    open_mask. Comparisons, diffs and the wire encoding are plain integer operations.
+    """
+
+    __slots__ = ("open_mask", "known_mask")
+
+    def __init__(self, open_mask=0, known_mask=0):
+        self.open_mask = open_mask & known_mask
+        self.known_mask = known_mask
+
+    @classmethod
+    def from_dict(cls, valve_status):
+        """Build a state from a {name: status} dict, normalizing every name and status."""
+        state = cls()
+        for name, status in (valve_status or {}).items():
+            valve_name = normalize_valve_name(name)
+            if valve_name is not None:
+                state = state.with_status(valve_name, status)
+        return state
+
+    @classmethod
+    def parse_status_line(cls, text):
+        """Parse "Valve_1=OPEN, Valve_2=CLOSED" into a normalized {name: status} dict."""
+        updates = {}
+        for update in text.replace("VALVE_STATUS:", "").split(","):
+            if not update.strip():
+                continue
+            if update.count("=") != 1:
+                raise ValueError(f"Invalid valve status format: {update.strip()}")
+            name, status = update.split("=")
+            valve_name = normalize_valve_name(name)
+            if valve_name is None:
+                raise ValueError(f"Unknown valve: {name.strip()}")
+            updates[valve_name] = normalize_valve_status(status)
+        return updates
+
+    @classmethod
+    def decode(cls, value):
+        """Inverse of encode()."""
+        value = int(value)
+        return cls(open_mask=value & 0xFF, known_mask=(value >> 8) & 0xFF)
+
+    def encode(self):
+        """Pack the state into one integer: known_mask in the high byte, open_mask in the low byte."""
+        return (self.known_mask << 8) | self.open_mask
+
+    def status(self, name):
+        bit = 1 << VALVE_INDEX[name]
+        if not self.known_mask & bit:
+            return UNKNOWN
+        return OPEN if self.open_mask & bit else CLOSED
+
+    def with_status(self, name, status):
+        """Return a copy of the state with one valve set to status."""
+        bit = 1 << VALVE_INDEX[normalize_valve_name(name)]
+        status = normalize_valve_status(status)
+        if status == UNKNOWN:
+            return ValveState(self.open_mask & ~bit, self.known_mask & ~bit)
+        open_mask = self.open_mask | bit if status == OPEN else self.open_mask & ~bit
+        return ValveState(open_mask, self.known_mask | bit)
+
+    def merge(self, updates):
+        """Return a copy of the state with a {name: status} dict applied."""
+        state = self
+        for name, status in updates.items():
+            state = state.with_status(name, status)
+        return state
+
+    def diff(self, other):
+        """Return [(name, old, new)] for every valve whose status differs in other."""
+        changed = (self.open_mask ^ other.open_mask) | (self.known_mask ^ other.known_mask)
+        return [
+            (name, self.status(name), other.status(name))
+            for index, name in enumerate(VALVE_NAMES) if changed & (1 << index)
+        ]
+
+    def to_dict(self, include_unknown=False):
+        """Return {name: status} in valve order, omitting unknown valves unless asked."""
+        return {
+            name: self.status(name) for name in VALVE_NAMES
+            if include_unknown or self.status(name) != UNKNOWN
+        }
+
+    def to_status_line(self):
+        """Return the canonical "VALVE_1=OPEN, VALVE_2=CLOSED" form of the known valves."""
+        return ", ".join(f"{name}={status}" for name, status in self.to_dict().items())
+
+    def __eq__(self, other):
+        if not isinstance(other, ValveState):
+            return NotImplemented
+        return self.open_mask == other.open_mask and self.known_mask == other.known_mask
+
+    def __hash__(self):
+        return self.encode()
+
+    def __repr__(self):
+        return f"ValveState(open_mask=0b{self.open_mask:08b}, known_mask=0b{self.known_mask:08b})"